@@ -0,0 +1,334 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+# @misc{cavallaro2020disrupting,
+#     title={Disrupting Resilient Criminal Networks through Data Analysis: The case of Sicilian Mafia},
+#     author={Lucia Cavallaro and Annamaria Ficara and Pasquale De Meo and Giacomo Fiumara and Salvatore Catanese and
+#             Ovidiu Bagdasar and Antonio Liotta},
+#     year={2020},
+#     eprint={2003.05303},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+"""Time the hot functions and the sweeps of the missing data and disruption projects on synthetic graphs"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import networkx as nx
+import numpy as np
+import pandas as pd
+import prettytable
+import scipy
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(_here, '..', '..', 'missing_data', 'src'))
+import utilspackage.cache_utils as cache_utils
+import utilspackage.graph_utils as graph
+import utilspackage.math_utils as math
+import missing_data_main as main
+
+# The disruption script is not an importable module name
+_spec = importlib.util.spec_from_file_location(
+    'network_disruption', os.path.join(_here, '..', '..', 'disruption', 'src', 'network-disruption.py'))
+disruption = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(disruption)
+
+# Benchmark Configuration
+sizes = [100, 1000, 10000, 100000]  # Number of nodes of the synthetic graphs
+generators = ['block', 'powerlaw']  # Synthetic graph families (see block_graph and powerlaw_graph)
+seed = 0  # Seed of the synthetic graphs and of the pruning draws
+repeat = 3  # Runs of the fast cases (below min_time seconds), the best time is kept
+min_time = 0.2  # Cases slower than this are run once
+memory = True  # if True, run each case once more under tracemalloc to record its peak memory
+tolerance = 1.25  # Time ratio to the baseline above which a case is reported as a regression
+noise = 1e-3  # Cases faster than this (seconds) in the baseline are not checked (timer noise)
+output = '../results/benchmark_{0}.json'  # Machine-readable results ({0}: date and time of the run)
+baseline = '../results/baseline.json'  # Stored baseline (see --save-baseline)
+
+# Largest graph (number of nodes) of each case: dense n x n matrices and O(n^2) sweeps do not scale to 10^5 nodes
+limits = {
+    ('compute_S', 'dense'): 3000,
+    ('compute_S', 'sparse'): 3000,
+    ('compute_Matsusita_difference', 'dense'): 3000,
+    ('compute_spectral_distances', 'exact'): 2000,
+    ('compute_spectral_distances', 'partial'): 100000,
+    ('update_spectra', 'one-edge'): 2000,
+    ('update_spectra', 'one-edge-full'): 2000,
+    ('network_links_pruning', 'networkx'): 10000,
+    ('network_links_pruning', 'csr'): 10000,
+    ('lcc_size', 'networkx'): 100000,
+    ('lcc_size', 'csr'): 100000,
+    ('disruption', 'degree-block'): 10000,
+    ('disruption', 'degree-block-csr'): 10000,
+    ('disruption', 'ci-sequential'): 1000,
+    ('disruption', 'betweenness-block'): 300,
+    ('missing_data_sweep', 'independent'): 1000,
+    ('missing_data_sweep', 'nested'): 1000,
+}
+
+
+def block_graph(n, seed, block=30, p_in=0.2, k_out=1.0):
+    """
+    Generate a stochastic block graph shaped as a criminal network: clans of about block members densely connected
+    among them, plus k_out edges per node on average between random nodes of any clan. The weights (e.g., number of
+    calls or meetings) are geometric, as in the Montagna datasets.
+
+    :param n: (int) Number of nodes.
+    :param seed: (int) Seed of the graph.
+    :param block: (int) Size of the clans.
+    :param p_in: (float) Probability of an edge between two members of a clan.
+    :param k_out: (float) Average number of edges per node outside its clan.
+    :return: (Graph obj) Graph with nodes labelled 0..n-1.
+    """
+    rng = np.random.RandomState(seed)
+    edges = []
+    for members in np.array_split(np.arange(n), max(1, n // block)):
+        u, v = np.triu_indices(len(members), 1)
+        keep = rng.rand(len(u)) < p_in
+        edges.append(np.column_stack([members[u[keep]], members[v[keep]]]))
+    m_out = int(k_out * n / 2)
+    edges.append(np.column_stack([rng.randint(n, size=m_out), rng.randint(n, size=m_out)]))
+    return weighted_graph(n, np.concatenate(edges), rng)
+
+
+def powerlaw_graph(n, seed, m=2, p=0.5):
+    """
+    Generate a power-law clustered graph (Holme and Kim): a few hubs and many triangles, as in the Montagna datasets.
+
+    :param n: (int) Number of nodes.
+    :param seed: (int) Seed of the graph.
+    :param m: (int) Edges of each new node.
+    :param p: (float) Probability of closing a triangle after each edge.
+    :return: (Graph obj) Graph with nodes labelled 0..n-1.
+    """
+    G = nx.powerlaw_cluster_graph(n, m, p, seed=seed)
+    return weighted_graph(n, np.array(list(G.edges()), dtype=np.int64), np.random.RandomState(seed))
+
+
+def weighted_graph(n, edges, rng):
+    """
+    Build a Graph of the nodes 0..n-1 from an edge array (self-loops and duplicates dropped), with geometric weights.
+
+    :param n: (int) Number of nodes.
+    :param edges: (numpy.ndarray) The m x 2 array of the edges.
+    :param rng: (numpy.random.RandomState) Random generator of the weights.
+    :return: (Graph obj) Graph with nodes labelled 0..n-1.
+    """
+    edges = np.unique(np.sort(edges[edges[:, 0] != edges[:, 1]], axis=1), axis=0)
+    weights = rng.geometric(0.5, size=len(edges))
+    G = nx.Graph()
+    G.add_nodes_from(range(n))
+    G.add_weighted_edges_from(zip(edges[:, 0].tolist(), edges[:, 1].tolist(), weights.tolist()))
+    return G
+
+
+def prepare_cases(G, name, workdir, functions=None):
+    """
+    Prepare the cases of a graph: for each (function, variant) within its size limit, a function without arguments
+    running it (the preparation, e.g. S of the original graph for the Matsusita difference, is not timed). The cases
+    of the functions not selected are never prepared.
+
+    :param G: (Graph obj) Synthetic graph.
+    :param name: (str) Name of the graph (also the name of its edge list for the sweeps).
+    :param workdir: (str) Folder of the edge lists of the sweeps.
+    :param functions: (list) Functions to time (None for all of them).
+    :return: (generator) (function, variant, run) triplets.
+    """
+    n = G.number_of_nodes()
+    fraction = max(1, int(0.05 * G.number_of_edges()))
+
+    def fits(case):
+        return (functions is None or case[0] in functions) and n <= limits.get(case, 0)
+
+    def pruned():
+        # Same kind of graph as network_links_pruning, without its cost (one edge list per removed edge)
+        edges = list(G.edges())
+        Gm = G.copy()
+        Gm.remove_edges_from(edges[i] for i in np.random.RandomState(seed).choice(len(edges), fraction, replace=False))
+        return Gm
+
+    if fits(('compute_S', 'dense')):
+        yield 'compute_S', 'dense', lambda: math.compute_S(G)
+    if fits(('compute_S', 'sparse')):
+        perm = math.deltacon_ordering(G)
+        yield 'compute_S', 'sparse', lambda: math.compute_S(G, backend='sparse', perm=perm)
+    if fits(('compute_Matsusita_difference', 'dense')):
+        S1, S2 = math.compute_S(G), math.compute_S(pruned())
+        yield 'compute_Matsusita_difference', 'dense', lambda: math.compute_Matsusita_difference(n, S1, S2)
+        del S1, S2
+    if fits(('compute_spectral_distances', 'exact')):
+        spectra, Gm = math.compute_spectra(G), pruned()
+        yield 'compute_spectral_distances', 'exact', lambda: math.compute_spectral_distances(G, Gm, zip(*spectra))
+    if fits(('compute_spectral_distances', 'partial')):
+        Gm = pruned()
+        yield 'compute_spectral_distances', 'partial', lambda: math.spectra_distances(
+            math.compute_partial_spectra(G, 10), math.compute_partial_spectra(Gm, 10))
+    if fits(('update_spectra', 'one-edge')) or fits(('update_spectra', 'one-edge-full')):
+        # Secular-equation updates of the spectra for one removed edge, against the full decompositions they replace
+        # (forced by max_updates=0, with the same construction of the matrices)
+        eigenpairs, edge = math.compute_eigenpairs(G), [next(iter(G.edges()))]
+        for variant, max_updates in (('one-edge', 8), ('one-edge-full', 0)):
+            if fits(('update_spectra', variant)):
+                yield 'update_spectra', variant, lambda max_updates=max_updates: math.update_spectra(
+                    G, eigenpairs, edge, max_updates=max_updates)
+    if fits(('network_links_pruning', 'networkx')):
+        yield 'network_links_pruning', 'networkx', lambda: math.network_links_pruning(
+            G, fraction, rng=random.Random(seed))
+    if fits(('network_links_pruning', 'csr')) or fits(('lcc_size', 'csr')) or fits(('disruption', 'degree-block-csr')):
+        G_csr = graph.from_networkx(G)
+    if fits(('network_links_pruning', 'csr')):
+        yield 'network_links_pruning', 'csr', lambda: math.network_links_pruning(
+            G_csr, fraction, rng=random.Random(seed))
+    if fits(('lcc_size', 'networkx')):
+        yield 'lcc_size', 'networkx', lambda: disruption.lcc_size(G)
+    if fits(('lcc_size', 'csr')):
+        yield 'lcc_size', 'csr', lambda: disruption.lcc_size(G_csr)
+    for variant, label, casekey, compact in (('degree-block', 'Degree', 2, False),
+                                             ('degree-block-csr', 'Degree', 2, True),
+                                             ('ci-sequential', 'Collective Influence', 1, False),
+                                             ('betweenness-block', 'Betweenness', 2, False)):
+        if fits(('disruption', variant)):
+            yield 'disruption', variant, lambda label=label, casekey=casekey, compact=compact: disruption.disruption(
+                G_csr.copy() if compact else G.copy(), disruption.f[label], label, disruption.lcc_size(G),
+                pd.DataFrame(), pd.DataFrame(), casekey)
+    for variant in ('independent', 'nested'):
+        if fits(('missing_data_sweep', variant)):
+            with open(os.path.join(workdir, name + '.csv'), 'w') as fout:
+                for u, v, w in G.edges(data='weight'):
+                    fout.write('{0}\t{1}\t{2}\n'.format(u, v, w))
+            yield 'missing_data_sweep', variant, lambda variant=variant: sweep(name, workdir, variant,
+                                                                               G.number_of_edges())
+
+
+def sweep(file, workdir, design, edges):
+    """
+    Run the whole missing data sweep of an edge list (4 replicates, 3 pruning levels), as missing_data_main on a
+    single process, from the reading of the file to the last distance.
+
+    :param file: (str) Name of the edge list (without the extension).
+    :param workdir: (str) Folder of the edge list.
+    :param design: (str) 'independent' or 'nested'.
+    :param edges: (int) Number of edges of the graph.
+    """
+    main.dataset_dir, main.cache_dir, main.design, main.seed, main.workers = workdir + os.sep, None, design, seed, None
+    main.nrep, main.torem = 4, 3.5 / edges  # 3 levels
+    main._states.clear()
+    number_toberemoved = main.setup(file)['number']
+    for task in main.tasks_of(0, file, number_toberemoved):
+        main.run_task(task)
+
+
+def measure(run):
+    """
+    Time a case (best of repeat runs if it is fast) and record its peak memory (one more run under tracemalloc).
+
+    :param run: (function) Case to be run.
+    :return: (tuple) Best time in seconds, number of timed runs and peak memory in bytes (None if not recorded).
+    """
+    times = []
+    while len(times) < repeat:
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        if times[0] > min_time:
+            break
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(times), len(times), peak
+
+
+def compare(records, reference):
+    """
+    Compare the times of a run with the ones of a baseline, case by case.
+
+    :param records: (list) Records of the run.
+    :param reference: (list) Records of the baseline.
+    :return: (list) Records of the cases slower than tolerance times the baseline (except the ones below noise).
+    """
+    key = lambda record: (record['function'], record['variant'], record['graph'], record['n'])
+    before = {key(record): record for record in reference}
+    t = prettytable.PrettyTable(['Function', 'Variant', 'Graph', 'n', 'Baseline (s)', 'Run (s)', 'Ratio'])
+    regressions = []
+    for record in records:
+        if key(record) not in before:
+            continue
+        ratio = record['seconds'] / max(before[key(record)]['seconds'], 1e-9)
+        t.add_row([record['function'], record['variant'], record['graph'], record['n'],
+                   round(before[key(record)]['seconds'], 4), round(record['seconds'], 4), round(ratio, 2)])
+        if ratio > tolerance and before[key(record)]['seconds'] >= noise:
+            regressions.append(record)
+    print(t)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the missing data and disruption functions")
+    parser.add_argument('--sizes', type=int, nargs='+', default=sizes, help='numbers of nodes')
+    parser.add_argument('--generators', nargs='+', default=generators, choices=['block', 'powerlaw'])
+    parser.add_argument('--functions', nargs='+', default=None, help='only these functions (default: all)')
+    parser.add_argument('--no-memory', action='store_true', help='do not record the peak memory')
+    parser.add_argument('--baseline', default=baseline, help='baseline to compare with (if it exists)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args()
+    memory = not args.no_memory
+    cache_utils.configure(None)  # Cold runs: the invariants are always computed
+    disruption.cache_utils.configure(None)
+
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for family in args.generators:
+            for n in args.sizes:
+                G = block_graph(n, seed) if family == 'block' else powerlaw_graph(n, seed)
+                name = '{0}_{1}'.format(family, n)
+                print("\nGraph: ", name, "-", G.number_of_nodes(), "nodes,", G.number_of_edges(), "edges")
+                for function, variant, run in prepare_cases(G, name, workdir, args.functions):
+                    seconds, runs, peak = measure(run)
+                    print("{0:30} {1:20} {2:10.6f} s {3}".format(function, variant, seconds,
+                                                                  '' if peak is None else
+                                                                  '{0:.1f} MB'.format(peak / 2 ** 20)))
+                    records.append(dict(function=function, variant=variant, graph=family, n=n,
+                                        m=G.number_of_edges(), seconds=seconds, runs=runs, peak_bytes=peak))
+
+    result = dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), seed=seed, platform=platform.platform(),
+                  python=platform.python_version(), numpy=np.__version__, scipy=scipy.__version__,
+                  networkx=nx.__version__, records=records)
+    path = output.format(time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fout:
+        json.dump(result, fout, indent=1)
+    print("\nResults saved in", path)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fout:
+            json.dump(result, fout, indent=1)
+        print("Baseline saved in", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as fin:
+            regressions = compare(records, json.load(fin)['records'])
+        if regressions:
+            print(len(regressions), "case(s) slower than", tolerance, "times the baseline")
+            sys.exit(1)
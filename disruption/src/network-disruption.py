@@ -14,25 +14,69 @@ __author__ = "Lucia Cavallaro, Pasquale De Meo, Annamaria Ficara, and Giacomo Fi
 __version__ = "0.0.1"
 # In[1]:
 
+import argparse
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 import copy
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
 import pandas as pd
 import array
+import heapq
 import operator
 
+# Compact array-backed graph shared with the missing data project
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'missing_data', 'src'))
+import utilspackage.cache_utils as cache_utils
+import utilspackage.file_utils as utils
+import utilspackage.graph_utils as graph
+import utilspackage.profile_utils as prof
+import utilspackage.sweep_utils as sweep
+
 
 names = ['id', 'data']
 formats = ['int32', 'int32']
 dtype = dict(names=names, formats=formats)
 
 filename = {'Montagna_meetings_edgelist': 'meeting', 'Montagna_phonecalls_edgelist': 'phone_calls'}
+merge = 'last'  # Weight of the edges repeated in the datasets: 'last' (as read row by row), 'sum' or 'max'
+cache_dir = '../../dataset/.cache'  # Binary cache of the parsed datasets, keyed by their hash (None to disable)
+invariants_dir = '../../dataset/.cache/invariants'  # Cache of the first LCC and centralities (None to disable)
+invariants_size = 2 ** 30  # Bytes of the invariants cache (least recently used entries evicted above it)
 nrem = 5  # top valued nodes to be removed
+lcc_mode = 'reverse'  # LCC curves: 'reverse' (union-find replay of the removal order), 'forward' or 'networkx'
+stop_fraction = None  # if float, stop a disruption once its LCC is below this fraction of the initial LCC
+stop_patience = None  # if int k, stop a disruption once its LCC size is unchanged for k points of the curve
+disruption_targets = (0.5, 0.9)  # Robustness summaries: removals needed to reduce the LCC by these fractions
+ci_radius = 1  # Collective Influence ball radius l
+ci_incremental = True  # if True, keep the CI scores in a max-heap updated around each removed node
+betweenness_k = 32  # Pivots (source nodes) of the sampled betweenness
+betweenness_seed = 0  # Seed of the pivots of the sampled betweenness
+betweenness_delta = 0.05  # Failure probability of the error bound reported for the sampled betweenness
+katz_alpha = 0.1  # Katz attenuation factor (as nx.katz_centrality_numpy), if below the convergence radius
+katz_safety = 0.9  # Otherwise, alpha = katz_safety / (spectral radius bound of the original graph)
+katz_tol = 1e-12  # Relative residual of the Katz conjugate gradient solves
+katz_decimals = 9  # Decimals of the Katz scores (ties below the accuracy of the solves are broken by node order)
+workers = None  # if int, run the (dataset, weighting, case, centrality) cells on a pool of that many processes
+csr = False  # if True, run the disruptions on the compact graph of utilspackage.graph_utils (same curves)
+profile_dir = '../results/profile'  # Per-dataset time breakdowns (and trace.json) of the profiled runs (--profile)
+partial_dir = '../results/partial'  # Curves of the cells run by each shard (--shard), gathered by --merge
+
+_betweenness_cache = dict()  # Raw betweenness and component labels of the last Graph seen by betweenness_dynamic
+_katz_cache = dict()  # Alpha and last solution of the last Graph seen by katz_sparse
+_edges = dict()  # Edge arrays of the original graphs, per dataset name (shipped once to each worker)
+_graphs = dict()  # Original graphs rebuilt from _edges, once per process and dataset
+cache_utils.configure(invariants_dir, invariants_size)
 
 
-def collective_influence_centality(Graph, torem, weight=None):
+def collective_influence_centality(Graph, torem, weight=None, radius=None):
     """
-    Compute Collective Influence (CI) Centrality per each node (up to distance d=2).
+    Compute Collective Influence (CI) Centrality per each node (ball of radius l, see collective_influence).
     Decreasing order: from lowest to highest CI
 
     :param Graph: (Graph obj) Input Graph.
@@ -40,20 +84,13 @@ def collective_influence_centality(Graph, torem, weight=None):
     :param weight : (string) None or string, optional (default=None)
       If None, all edge weights are considered equal.
       Otherwise holds the name of the edge attribute used as weight.
+    :param radius: (int) Ball radius l. If None, ci_radius is used.
     :return: (array.array) Sorted by CI numpy array (from higher to lower).
     """
+    radius = ci_radius if radius is None else radius
     colinf = dict()
     for node in Graph:
-        summatory = 0
-        for iter_node in Graph.neighbors(node):
-            if weight is None:
-                summatory += Graph.degree(iter_node) - 1
-            else:
-                summatory += Graph.degree(iter_node, weight='weight') - 1
-        if weight is None:
-            colinf[node] = (Graph.degree(node) - 1) * summatory
-        else:
-            colinf[node] = (Graph.degree(node, weight='weight') - 1) * summatory
+        colinf[node] = collective_influence(Graph, node, radius, weight=weight)
     npcolinf = np.fromiter(colinf.items(), dtype=dtype, count=len(colinf))
     sorted_colinf = np.sort(npcolinf, order='data')
     for rem_n in range(1, nrem + 1):
@@ -62,6 +99,112 @@ def collective_influence_centality(Graph, torem, weight=None):
     return torem
 
 
+def ball(Graph, node, radius):
+    """
+    Compute the distance from a node of the nodes within a given radius (breadth-first search).
+
+    :param Graph: (Graph obj) Input Graph.
+    :param node: Center of the ball.
+    :param radius: (int) Radius of the ball.
+    :return: (dict) Distance per node of the ball (the center included).
+    """
+    distance = {node: 0}
+    frontier = [node]
+    for d in range(1, radius + 1):
+        if not frontier:
+            break
+        reached = []
+        for iter_node in frontier:
+            for neighbor in Graph.neighbors(iter_node):
+                if neighbor not in distance:
+                    distance[neighbor] = d
+                    reached.append(neighbor)
+        frontier = reached
+    return distance
+
+
+def collective_influence(Graph, node, radius, weight=None):
+    """
+    Compute the Collective Influence of a node, CI_l(i) = (k_i - 1) * sum_j (k_j - 1), where j runs over the
+    frontier of the ball of radius l centered in i (the nodes at distance exactly l). For l = 1 it is the sum over
+    the neighbors.
+
+    :param Graph: (Graph obj) Input Graph.
+    :param node: Input node.
+    :param radius: (int) Ball radius l.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight (k is the weighted degree).
+    :return: (float) CI score of the node.
+    """
+    summatory = 0
+    for iter_node, d in ball(Graph, node, radius).items():
+        if d == radius:
+            summatory += Graph.degree(iter_node, weight=weight) - 1
+    return (Graph.degree(node, weight=weight) - 1) * summatory
+
+
+def collective_influence_heap(Graph, radius, weight=None):
+    """
+    Compute the CI scores of all the nodes and keep them in a max-heap for the adaptive CI removal (Morone-Makse):
+    after each removal only the scores of the nodes within radius l + 1 of the removed node change
+    (see collective_influence_update), so they are the only ones recomputed.
+    Ties are broken by the highest node label, as in collective_influence_centality.
+
+    :param Graph: (Graph obj) Input Graph.
+    :param radius: (int) Ball radius l.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight.
+    :return: (dict) CI score per node ('ci'), heap of (-score, -node) entries ('heap'), radius and weight.
+    """
+    engine = {'ci': dict(), 'heap': [], 'radius': radius, 'weight': weight}
+    for node in Graph:
+        engine['ci'][node] = collective_influence(Graph, node, radius, weight=weight)
+        engine['heap'].append((-engine['ci'][node], -node))
+    heapq.heapify(engine['heap'])
+    return engine
+
+
+def collective_influence_update(Graph, engine, nodes):
+    """
+    Recompute the CI scores of some nodes after a removal and push them into the heap. The outdated entries are
+    left in the heap and skipped when popped (lazy deletion).
+
+    :param Graph: (Graph obj) Input Graph, after the removal.
+    :param engine: (dict) CI heap (see collective_influence_heap).
+    :param nodes: (iterable) Nodes within radius l + 1 of the removed node, computed before its removal (see ball).
+    """
+    for node in nodes:
+        if node not in Graph:
+            engine['ci'].pop(node, None)
+            continue
+        ci = collective_influence(Graph, node, engine['radius'], weight=engine['weight'])
+        if ci != engine['ci'][node]:
+            engine['ci'][node] = ci
+            heapq.heappush(engine['heap'], (-ci, -node))
+
+
+def collective_influence_top(engine, torem):
+    """
+    Append the nrem nodes with the highest CI to the array of the nodes to be removed (from higher to lower),
+    leaving them in the heap.
+
+    :param engine: (dict) CI heap (see collective_influence_heap).
+    :param torem: (array.array)  Array of nodes to be removed
+    :return: (array.array) Nodes to be removed.
+    """
+    top = []
+    while len(top) < nrem and engine['heap']:
+        entry = heapq.heappop(engine['heap'])
+        if engine['ci'].get(-entry[1]) == -entry[0]:  # Skip the entries of removed nodes and outdated scores
+            top.append(entry)
+    for entry in top:
+        heapq.heappush(engine['heap'], entry)
+        torem.append(-entry[1])
+    return torem
+
+
 def average_degree(Graph):  # ToDo: Unused Function. Removal Considered.
     """
     Compute Average Degree in the input Graph.
@@ -69,6 +212,8 @@ def average_degree(Graph):  # ToDo: Unused Function. Removal Considered.
     :param Graph: (Graph obj) Input Graph.
     :return: (float) Average Degree in Graph.
     """
+    if isinstance(Graph, graph.CSRGraph):
+        return Graph.degree_array[Graph.node_mask].sum() / float(Graph.number_of_nodes())
     degree = []
     for x in nx.degree(Graph):
         degree.append(x[1])
@@ -82,12 +227,166 @@ def lcc_size(Graph):
     :param Graph: (Graph obj) Input Graph.
     :return: (int) Size of the LCC.
     """
+    if isinstance(Graph, graph.CSRGraph):
+        return Graph.lcc_size()
     compsize = []
     for c in nx.connected_components(Graph):
         compsize.append(nx.number_of_nodes(Graph.subgraph(c)))
     return max(compsize)
 
 
+def lcc_reverse(Graph, order):
+    """
+    Compute the Largest Connected Component (LCC) size after each prefix of a removal order, replaying the order
+    backwards (Newman-Ziff reverse percolation): the nodes are added back one at a time into a union-find
+    structure, so the whole curve costs O((n + m) a(n)) instead of one connected components search per removal.
+
+    :param Graph: (Graph obj) Input Graph, before any removal.
+    :param order: (list) Nodes in order of removal.
+    :return: (list) LCC size after the removal of the first k nodes, for k = 0..len(order).
+    """
+    parent = dict()
+    size = dict()
+    largest = 0
+    lcc = [0] * (len(order) + 1)
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]  # Path halving
+            node = parent[node]
+        return node
+
+    def add(node, largest):
+        parent[node] = node
+        size[node] = 1
+        for neighbor in Graph.neighbors(node):
+            if neighbor in parent:
+                root, other = find(node), find(neighbor)
+                if root != other:
+                    if size[root] < size[other]:  # Union by size
+                        root, other = other, root
+                    parent[other] = root
+                    size[root] += size[other]
+        return max(largest, size[find(node)])
+
+    removed = set(order)
+    for node in Graph:
+        if node not in removed:
+            largest = add(node, largest)
+    lcc[len(order)] = largest
+    for k in range(len(order) - 1, -1, -1):
+        largest = add(order[k], largest)
+        lcc[k] = largest
+    return lcc
+
+
+def connected_component(Graph, node):
+    """
+    Compute the nodes of the connected component of a node (as nx.node_connected_component, for both graph types).
+
+    :param Graph: (Graph obj) Input Graph (or graph_utils.CSRGraph).
+    :param node: Input node.
+    :return: (set) Nodes of the connected component.
+    """
+    return set(ball(Graph, node, len(Graph)))
+
+
+def lcc_tracker(Graph):
+    """
+    Label the connected components of a Graph for the incremental (forward) LCC tracking of lcc_remove_node.
+
+    :param Graph: (Graph obj) Input Graph.
+    :return: (dict) Component label per node ('label') and size per component label ('size').
+    """
+    tracker = {'label': dict(), 'size': dict(), 'next': 0}
+    for node in Graph:
+        if node not in tracker['label']:
+            component = connected_component(Graph, node)
+            tracker['label'].update(dict.fromkeys(component, tracker['next']))
+            tracker['size'][tracker['next']] = len(component)
+            tracker['next'] += 1
+    return tracker
+
+
+def lcc_remove_node(Graph, tracker, node):
+    """
+    Remove a node from a Graph and update its component labels: only the component that contained the node may
+    split, so it is the only one searched again.
+
+    :param Graph: (Graph obj) Input Graph (modified in place).
+    :param tracker: (dict) Component labels of the Graph (see lcc_tracker).
+    :param node: Node to be removed.
+    :return: (int) Size of the LCC after the removal.
+    """
+    neighbors = list(Graph.neighbors(node))
+    Graph.remove_node(node)
+    label = tracker['label'].pop(node)
+    del tracker['size'][label]
+    for neighbor in neighbors:
+        if tracker['label'][neighbor] == label:  # Not yet reached from another neighbor
+            c = tracker['next']
+            tracker['next'] += 1
+            component = connected_component(Graph, neighbor)
+            tracker['label'].update(dict.fromkeys(component, c))
+            tracker['size'][c] = len(component)
+    return max(tracker['size'].values(), default=0)
+
+
+def robustness_start(lccinit, n):
+    """
+    Start the robustness summary of a disruption curve, computed while the curve is drawn (see robustness_update).
+
+    :param lccinit: (int) Largest Connected Component size of the initial graph.
+    :param n: (int) Number of nodes of the initial graph.
+    :return: (dict) Empty summary.
+    """
+    return {'lccinit': lccinit, 'n': n, 'kiter': 0, 'lcc': None, 'rho': 1.0, 'unchanged': 0, 'auc': 0.0,
+            'r_index': 0.0, 'removals': dict.fromkeys(disruption_targets), 'stopped': None}
+
+
+def robustness_update(robust, kiter, lcc):
+    """
+    Add a point of a disruption curve to its robustness summary: the area under the curve of rho_i (trapezoids over
+    the fraction of removed nodes), the R-index (Schneider et al.: mean fraction of nodes in the LCC after each
+    removal, the LCC being constant between two points of the curve) and the removals needed to reduce the LCC by
+    each fraction of disruption_targets. Then check the early termination rules (stop_fraction and stop_patience).
+
+    :param robust: (dict) Summary of the curve so far (see robustness_start).
+    :param kiter: (int) Number of nodes removed.
+    :param lcc: (int) LCC size after kiter removals.
+    :return: (bool) True if the disruption can stop.
+    """
+    rho = 1 - (abs((lcc - robust['lccinit']) / robust['lccinit']))
+    step = kiter - robust['kiter']
+    robust['auc'] += (robust['rho'] + rho) / 2 * step / robust['n']
+    robust['r_index'] += lcc / robust['n'] * step / robust['n']
+    for target, removals in robust['removals'].items():
+        if removals is None and rho <= 1 - target:
+            robust['removals'][target] = kiter
+    robust['unchanged'] = robust['unchanged'] + 1 if lcc == robust['lcc'] else 0
+    robust['kiter'], robust['lcc'], robust['rho'] = kiter, lcc, rho
+    if stop_fraction is not None and rho < stop_fraction:
+        robust['stopped'] = 'fraction'
+    elif stop_patience is not None and robust['unchanged'] >= stop_patience:
+        robust['stopped'] = 'patience'
+    return robust['stopped'] is not None
+
+
+def robustness_summary(robust):
+    """
+    Robustness summary of a (possibly truncated) disruption curve, as a row of the robustness table.
+
+    :param robust: (dict) Summary of the curve (see robustness_update).
+    :return: (dict) Removals done, stopping rule that ended the curve (empty if none), AUC, R-index and removals
+      needed per disruption target (empty if not reached).
+    """
+    row = {'Removals': robust['kiter'], 'Stopped': robust['stopped'] or '', 'AUC': robust['auc'],
+           'R-index': robust['r_index']}
+    for target, removals in robust['removals'].items():
+        row['Removals to {0:g}%'.format(100 * target)] = '' if removals is None else removals
+    return row
+
+
 def max_centr(Graph, centrality_function, torem, weight=None):
     """
     Nodes sorting (as dict, key:node_name, value:centrality_score) according to the centrality function.
@@ -115,7 +414,7 @@ def max_centr(Graph, centrality_function, torem, weight=None):
 
 
 def disruption(Graph, centrality_function, centrality_label,
-               lccinit, dflcc, dflccvar, casekey, weight=None):
+               lccinit, dflcc, dflccvar, casekey, weight=None, summary=None):
     """
     Network Disruption. Compute Largest Connected Component (LCC) and Collective Influence (CI) after nodes removal.
 
@@ -134,6 +433,8 @@ def disruption(Graph, centrality_function, centrality_label,
     :param weight : (string) None or string, optional (default=None)
       If None, all edge weights are considered equal.
       Otherwise holds the name of the edge attribute used as weight.
+    :param summary: (dict) If given, filled with the robustness summary of the curve (see robustness_summary).
+    The curve is truncated as soon as a stopping rule holds (stop_fraction or stop_patience).
 
     :return dflcc: (pandas.core.frame.DataFrame) LCC Dataframe.
     (Dataframe will be composed by: Iter_Num, LCC size after node removal according to the Centrality_Metrics).
@@ -144,7 +445,20 @@ def disruption(Graph, centrality_function, centrality_label,
     dicty = dict()  # Dict current LCC normalized percentage variation compared with the initial LCC
     kiter = 0
     toremove = array.array('i', [])
-    while Graph.number_of_nodes() > nrem:
+    order = []  # Removed nodes, in order
+    robust = robustness_start(lccinit, Graph.number_of_nodes())
+    mode = lcc_mode
+    if mode == 'reverse' and (stop_fraction is not None or stop_patience is not None):
+        mode = 'forward'  # The stopping rules need the LCC size at each step
+    if mode == 'reverse':
+        Ginit = Graph.copy()  # The LCC sizes are filled in once the whole order is known
+    elif mode == 'forward':
+        tracker = lcc_tracker(Graph)
+        lcc = max(tracker['size'].values(), default=0)
+    engine = None
+    if centrality_label == 'Collective Influence' and ci_incremental:
+        engine = collective_influence_heap(Graph, ci_radius, weight=weight)
+    while Graph.number_of_nodes() > nrem and robust['stopped'] is None:
         # The while-loop stops when there are no enough nodes in the Graph to be removed.
         i = 0
         if casekey == 2:  # BLOCK
@@ -154,12 +468,19 @@ def disruption(Graph, centrality_function, centrality_label,
             # Step2: Create an array of N nodes with the highest score (to be removed)
             # Step3: Back to Step1.
             # NB: The next node's score (in nrem nodes to be removed at once) WILL NOTE BE affected.
-            dictx[kiter] = lcc_size(Graph)
-            dicty[kiter] = 1 - (abs((lcc_size(Graph) - lccinit) / lccinit))
-            if centrality_label == 'Collective Influence':
+            started = prof.start()
+            dictx[kiter] = lcc if mode == 'forward' else lcc_size(Graph) if mode == 'networkx' else None
+            if dictx[kiter] is not None and robustness_update(robust, kiter, dictx[kiter]):
+                break
+            started = prof.stop('lcc', started)
+            if engine is not None:
+                toremove = collective_influence_top(engine, toremove)
+            elif centrality_label == 'Collective Influence':
                 toremove = collective_influence_centality(Graph, toremove, weight=weight)
             elif centrality_label != 'Collective Influence':
                 toremove = max_centr(Graph, centrality_function, toremove, weight=weight)
+            prof.stop('centrality', started)
+            prof.count('centrality_calls')
 
         while i < nrem:
             if Graph.number_of_nodes() <= nrem:
@@ -171,16 +492,47 @@ def disruption(Graph, centrality_function, centrality_label,
                 # Step2: Create an array of N nodes with the highest score (to be removed)
                 # Step3: Back to Step1.
                 # NB: The next node's score (in nrem nodes to be removed at once) WILL BE affected.
-                dictx[kiter] = lcc_size(Graph)
-                dicty[kiter] = 1 - (abs((lcc_size(Graph) - lccinit) / lccinit))
-                if centrality_label == 'Collective Influence':
+                started = prof.start()
+                dictx[kiter] = lcc if mode == 'forward' else lcc_size(Graph) if mode == 'networkx' else None
+                if dictx[kiter] is not None and robustness_update(robust, kiter, dictx[kiter]):
+                    break
+                started = prof.stop('lcc', started)
+                if engine is not None:
+                    toremove = collective_influence_top(engine, toremove)
+                elif centrality_label == 'Collective Influence':
                     toremove = collective_influence_centality(Graph, toremove, weight=weight)
                 elif centrality_label != 'Collective Influence':
                     toremove = max_centr(Graph, centrality_function, toremove, weight=weight)
-            Graph.remove_node(toremove[0])
+                prof.stop('centrality', started)
+                prof.count('centrality_calls')
+            started = prof.start()
+            if engine is not None:
+                affected = ball(Graph, toremove[0], ci_radius + 1)
+                started = prof.stop('ci_update', started)
+            if mode == 'forward':
+                lcc = lcc_remove_node(Graph, tracker, toremove[0])
+            else:
+                Graph.remove_node(toremove[0])
+            started = prof.stop('removal', started)
+            if engine is not None:
+                collective_influence_update(Graph, engine, affected)
+                prof.stop('ci_update', started)
+            prof.count('iteration')
+            order.append(toremove[0])
             toremove.pop(0)
             kiter += 1
             i += 1
+    if mode == 'reverse':
+        started = prof.start()
+        lcc = lcc_reverse(Ginit, order)
+        dictx = {key: lcc[key] for key in dictx}
+        for key, value in dictx.items():
+            robustness_update(robust, key, value)
+        prof.stop('lcc', started)
+    if summary is not None:
+        summary.update(robustness_summary(robust))
+    for key, value in dictx.items():
+        dicty[key] = 1 - (abs((value - lccinit) / lccinit))
     dflcc['No'] = list(dictx.keys())
     dflccvar['No'] = dflcc['No']
     dflcc[centrality_label] = list(dictx.values())
@@ -188,6 +540,197 @@ def disruption(Graph, centrality_function, centrality_label,
     return dflcc, dflccvar
 
 
+def betweenness_sampled(Graph, weight=None):
+    """
+    Approximate the normalized Betweenness Centrality from betweenness_k random pivots (Brandes-Pich): the
+    dependencies of the pivots only are accumulated and extrapolated to all the sources, in O(k m) instead of
+    O(n m). The pivots are drawn with betweenness_seed (see betweenness_error_bound for the accuracy).
+
+    :param Graph: (Graph obj) Input Graph.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight.
+    :return: (dict) Approximated Betweenness Centrality per node.
+    """
+    k = min(betweenness_k, Graph.number_of_nodes())
+    if isinstance(Graph, graph.CSRGraph):
+        Graph = Graph.to_networkx()
+    return nx.betweenness_centrality(Graph, k=k, weight=weight, seed=betweenness_seed)
+
+
+def betweenness_error_bound(n, k, delta):
+    """
+    Bound the error of the sampled betweenness (Hoeffding inequality, union bound over the nodes): each pivot
+    contributes an unbiased estimate in [0, n / (n - 1)] of a normalized score, so with probability at least
+    1 - delta all the n scores are within the returned bound of the exact ones.
+
+    :param n: (int) Number of nodes.
+    :param k: (int) Number of pivots.
+    :param delta: (float) Failure probability.
+    :return: (float) Maximum absolute error of the normalized scores (0 if k >= n, i.e. exact).
+    """
+    if k >= n:
+        return 0.0
+    return n / (n - 1) * np.sqrt(np.log(2 * n / delta) / (2 * k))
+
+
+def betweenness_dynamic(Graph, weight=None):
+    """
+    Compute the normalized Betweenness Centrality exactly, but incrementally along a disruption: the shortest paths
+    never cross two connected components, so when nodes are removed from the Graph between two calls only the
+    components that lost them are searched again (Brandes on each of them), the others keep their raw scores.
+    The raw scores are cached for the last Graph object seen, which may only lose nodes between calls, and those of
+    a new Graph object (the original graph, at the first call of a disruption) in the disk cache of the invariants.
+
+    :param Graph: (Graph obj) Input Graph.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight.
+    :return: (dict) Betweenness Centrality per node (as nx.betweenness_centrality).
+    """
+    cache = _betweenness_cache
+    if cache.get('graph') is not Graph or cache['weight'] != weight or not cache['label'].keys() >= set(Graph):
+        nodes = list(Graph)
+        label, raw = cache_utils.cached('betweenness', Graph, (), lambda: betweenness_raw(Graph, weight),
+                                        weight=weight)
+        cache.update({'graph': Graph, 'weight': weight, 'label': dict(zip(nodes, label.tolist())),
+                      'raw': dict(zip(nodes, raw.tolist())), 'next': int(label.max(initial=-1)) + 1})
+    else:
+        removed = cache['label'].keys() - set(Graph)
+        labels = {cache['label'].pop(node) for node in removed}
+        for node in removed:
+            del cache['raw'][node]
+        stale = [node for node, label in cache['label'].items() if label in labels]
+        for node in stale:
+            del cache['label'][node]
+        betweenness_search(Graph, stale, weight, cache)
+    # Same rescaling as NetworkX: the unnormalized scores are already halved for undirected graphs
+    n = Graph.number_of_nodes()
+    scale = 2 * (1 / ((n - 1) * (n - 2))) if n > 2 else 2
+    return {node: cache['raw'][node] * scale for node in Graph}
+
+
+def betweenness_raw(Graph, weight=None):
+    """
+    Compute the raw (unnormalized) Betweenness Centrality of a Graph, component by component (see
+    betweenness_dynamic).
+
+    :param Graph: (Graph obj) Input Graph.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight.
+    :return: (tuple) Component label and raw score of each node, in the order of the Graph (numpy.ndarray).
+    """
+    cache = {'label': dict(), 'raw': dict(), 'next': 0}
+    betweenness_search(Graph, list(Graph), weight, cache)
+    return (np.array([cache['label'][node] for node in Graph], dtype=np.int64),
+            np.array([cache['raw'][node] for node in Graph], dtype=float))
+
+
+def betweenness_search(Graph, stale, weight, cache):
+    """
+    Search again (Brandes) the connected components of some nodes, updating their component labels and raw scores.
+
+    :param Graph: (Graph obj) Input Graph.
+    :param stale: (list) Nodes whose component is to be searched.
+    :param weight : (string) None or string. Name of the edge attribute used as weight.
+    :param cache: (dict) Component label ('label') and raw score ('raw') per node, and next free label ('next').
+    """
+    for node in stale:
+        if node in cache['label']:
+            continue
+        component = connected_component(Graph, node)
+        cache['label'].update(dict.fromkeys(component, cache['next']))
+        cache['next'] += 1
+        # Brandes on a copy (same node and neighbor order): searches through a subgraph view are much slower
+        if isinstance(Graph, graph.CSRGraph):
+            subgraph = Graph.to_networkx(component)
+        else:
+            subgraph = Graph if len(component) == len(Graph) else Graph.subgraph(component).copy()
+        cache['raw'].update(nx.betweenness_centrality(subgraph, normalized=False, weight=weight))
+
+
+def spectral_radius_bound(A):
+    """
+    Compute an upper bound of the spectral radius of a symmetric non-negative (adjacency) matrix: its largest
+    eigenvalue (ARPACK, with a small relative margin), or the largest row sum if ARPACK does not converge.
+    Removing nodes never increases it (Perron-Frobenius), so the bound of the original graph holds along a disruption.
+
+    :param A: (scipy.sparse.csr_matrix) Adjacency matrix.
+    :return: (float) Spectral radius bound.
+    """
+    rowsum = np.asarray(A.sum(axis=1)).ravel().max(initial=0)
+    if A.shape[0] <= 2:
+        return rowsum
+    try:
+        rho = spla.eigsh(A, k=1, which='LA', return_eigenvectors=False)[0]
+    except spla.ArpackNoConvergence:
+        return rowsum
+    return min(rowsum, rho * (1 + 1e-6))
+
+
+def katz_sparse(Graph, weight=None):
+    """
+    Compute the Katz Centrality by conjugate gradient on the sparse system (I - alpha A) x = 1, normalized as
+    nx.katz_centrality_numpy. Along a disruption each solve is warm-started from the previous solution with the
+    entries of the removed nodes dropped. Alpha is katz_alpha if alpha * rho < 1, with rho the cached spectral radius
+    bound of the original graph, otherwise katz_safety / rho: I - alpha A stays positive definite, so the solve
+    always converges (no PowerIterationFailedConvergence). The cache holds the last Graph object seen, which may only
+    lose nodes between calls; alpha and the solution of a new Graph object (the original graph, at the first call of
+    a disruption) are kept in the disk cache of the invariants.
+
+    :param Graph: (Graph obj) Input Graph.
+    :param weight : (string) None or string, optional (default=None)
+      If None, all edge weights are considered equal.
+      Otherwise holds the name of the edge attribute used as weight.
+    :return: (dict) Katz Centrality per node.
+    """
+    cache = _katz_cache
+    nodes = list(Graph)
+    if isinstance(Graph, graph.CSRGraph):
+        alive = np.flatnonzero(Graph.node_mask)
+        A = Graph.adjacency(weight)[alive][:, alive]
+    else:
+        # to_scipy_sparse_array since NetworkX 2.7 (to_scipy_sparse_matrix removed in 3.0)
+        to_sparse = getattr(nx, 'to_scipy_sparse_array', None) or nx.to_scipy_sparse_matrix
+        A = to_sparse(Graph, nodelist=nodes, weight=weight, format='csr', dtype=float)
+    if cache.get('graph') is not Graph or cache['weight'] != weight or not cache['x'].keys() >= set(nodes):
+        def first_solve():
+            rho = spectral_radius_bound(A)
+            alpha = katz_alpha if katz_alpha * rho < 1 else katz_safety / rho
+            return np.array([alpha]), katz_solve(A, alpha, np.ones(len(nodes)))
+        alpha, centrality = cache_utils.cached('katz', Graph, (katz_alpha, katz_safety, katz_tol), first_solve,
+                                               weight=weight)
+        cache.update({'graph': Graph, 'weight': weight, 'alpha': alpha[0].item()})
+    else:
+        centrality = katz_solve(A, cache['alpha'], np.array([cache['x'].get(node, 1.0) for node in nodes]))
+    cache['x'] = dict(zip(nodes, centrality))
+    norm = np.sign(sum(centrality)) * np.linalg.norm(centrality)
+    # Rounded to the accuracy of the solve, so tied nodes (e.g., symmetric ones) keep the order of the Graph
+    return dict(zip(nodes, map(float, np.round(centrality / norm, katz_decimals))))
+
+
+def katz_solve(A, alpha, x0):
+    """
+    Solve the Katz system (I - alpha A) x = 1 by conjugate gradient (by a sparse factorization if it fails).
+
+    :param A: (scipy.sparse.csr_matrix) Adjacency matrix.
+    :param alpha: (float) Attenuation factor, below the inverse of the spectral radius of A.
+    :param x0: (numpy.ndarray) Starting point.
+    :return: (numpy.ndarray) Solution x.
+    """
+    M = sp.identity(A.shape[0], format='csr') - alpha * A
+    b = np.ones(A.shape[0])
+    try:
+        centrality, info = spla.cg(M, b, x0=x0, rtol=katz_tol, atol=0.0, maxiter=10 * A.shape[0])
+    except TypeError:
+        # SciPy < 1.12 names the relative tolerance tol (removed in 1.14)
+        centrality, info = spla.cg(M, b, x0=x0, tol=katz_tol, atol=0.0, maxiter=10 * A.shape[0])
+    if info != 0:
+        centrality = spla.spsolve(M.tocsc(), b)
+    return centrality
+
+
 def degree_centrality_w(Graph, weight=None):
     # ToDo: In the future, it should be takes into account both number of in-edges and their weights.
     #  E.g. up to now, node A and node B has the same degree_centrality_w.
@@ -216,6 +759,9 @@ def degree_centrality_w(Graph, weight=None):
         return {nn: 1 for nn in Graph}
 
     s = 1.0 / (len(Graph) - 1.0)
+    if isinstance(Graph, graph.CSRGraph):  # Cached degree arrays
+        degree = Graph.degree_array if weight is None else Graph.wdegree_array
+        return dict(zip(Graph, (degree[Graph.node_mask] * s).tolist()))
     # New implementation:
     if weight is None:
         centrality = {nn: d * s for nn, d in Graph.degree()}
@@ -224,49 +770,317 @@ def degree_centrality_w(Graph, weight=None):
     return centrality
 
 
-if __name__ == '__main__':
-    for file, name in filename.items():  #  Iterate among the datasets: Meeting e Phone Calls
+cases = {1: 'sequential', 2: 'block'}
+w_enable = [None, 'weight']
+f = {
+    'Betweenness': betweenness_dynamic,  # Exact: nx.betweenness_centrality, incremental among components
+    # 'Betweenness (sampled)': betweenness_sampled,  # Pivot-sampled approximation (betweenness_k pivots)
+    'Katz': nx.katz_centrality_numpy,
+    # 'Katz': katz_sparse,  # Sparse warm-started solves (alpha below the convergence radius, scores to katz_decimals)
+    'Collective Influence': collective_influence_centality,
+    'Degree': degree_centrality_w
+}
+# NB: Use nx.katz_centrality_numpy (or katz_sparse) instead of nx.katz_centrality otherwise
+# PowerIterationFailedConvergence rise
+centrality_cost = {'Betweenness': 100, 'Katz': 10}  # Relative cost per call (default 1), to schedule slow cells first
 
-        #
-        # Data Extraction
-        #
-        fin = open('../../dataset/' + file + '.csv', 'r')
-        lines = fin.readlines()
+
+def read_edges(file):
+    """
+    Read the edge list of a dataset into compact arrays, with its repeated edges merged (see merge) and in order of
+    first appearance, so that the Graph rebuilt from them has the same node and neighbor order as the one read row
+    by row.
+
+    :param file: (str) Dataset file name (in ../../dataset, without the extension).
+    :return: (numpy.ndarray) m x 3 array of the edges: node, node, weight.
+    """
+    arrays = utils.load_edge_arrays('../../dataset/' + file, merge, cache_dir)
+    edges = np.zeros((len(arrays['edges']), 3), dtype=np.int64)
+    edges[:, :2] = np.asarray(arrays['labels'])[arrays['edges']]
+    edges[:, 2] = arrays['weights']
+    return edges
+
+
+def original_graph(name):
+    """
+    Rebuild (once per process) the original Graph of a dataset from its edge arrays.
+
+    :param name: (str) Dataset name.
+    :return: (Graph obj) Original Graph (not to be modified).
+    """
+    if name not in _graphs:
         G = nx.Graph()
-        for row in lines:
-            r = row.split()
-            n1, n2, w = int(r[0]), int(r[1]), int(r[2])
+        for n1, n2, w in _edges[name].tolist():
             G.add_edge(n1, n2, weight=w)
-        print("\nDataset: ", name)
-        print(nx.info(G), "\n")
-        Gor = copy.deepcopy(G)
-        #
-        # Disruption
-        #
-        lcc_init = lcc_size(G)  # Original LCC
-        cases = {1: 'sequential', 2: 'block'}
-        w_enable = [None, 'weight']
-
-        f = {
-            'Betweenness': nx.betweenness_centrality,
-            'Katz': nx.katz_centrality_numpy,
-            'Collective Influence': collective_influence_centality,
-            'Degree': degree_centrality_w
-        }
-        # NB: Use nx.katz_centrality_numpy instead of nx.katz_centrality otherwise PowerIterationFailedConvergence rise
-        for ww in w_enable:  # Iterate between weighted (string) and unweighted (None, by default) versions.
-            for k, v in cases.items():  # Iterate between Sequential and Block nodes removal.
-                df_lcc = pd.DataFrame()
+        _graphs[name] = G
+    return _graphs[name]
+
+
+def init_worker(edges, point=None):
+    """
+    Receive the edge arrays of the original graphs and the parameters of the point of the grid (once per worker
+    process).
+
+    :param edges: (dict) Edge arrays per dataset name (see read_edges).
+    :param point: (dict) Parameters of the point of the grid (see configure). None by default.
+    """
+    if point:
+        configure(point)
+    _edges.update(edges)
+
+
+def configure(point):
+    """
+    Set the parameters of a point of the sweep grid (module constants) in this process.
+
+    :param point: (dict) Value per parameter, e.g. {'nrem': 10}.
+    """
+    sweep.set_point(globals(), point)
+    _graphs.clear()
+    _betweenness_cache.clear()
+    _katz_cache.clear()
+
+
+def run_cell(cell):
+    """
+    Run the disruption of one (dataset, weighting, case, centrality) cell on a copy of the original Graph.
+
+    :param cell: (tuple) Dataset name, weight (None or 'weight'), case key and centrality label.
+    :return: (tuple) The cell, the iteration numbers, the LCC variation curve, its robustness summary and the
+      profile of the cell (None if the profiling is disabled).
+    """
+    name, ww, k, colname = cell
+    started = prof.start()
+    Gor = original_graph(name)
+    if csr:
+        if (name, 'csr') not in _graphs:
+            file = [file for file, dataset in filename.items() if dataset == name][0]
+            _graphs[(name, 'csr')] = utils.read_csr_graph('../../dataset/' + file, merge, cache_dir)
+        Gor = _graphs[(name, 'csr')]
+    lccinit = int(cache_utils.cached('lcc', Gor, (), lambda: (np.array([lcc_size(Gor)]),))[0][0])
+    Gcopy = Gor.copy() if csr else copy.deepcopy(Gor)
+    prof.stop('setup', started)
+    summary = dict()
+    df_lcc, df_lcc_var = disruption(Gcopy, f[colname], colname, lccinit, pd.DataFrame(), pd.DataFrame(), k, ww,
+                                    summary)
+    return cell, list(df_lcc_var['No']), list(df_lcc_var[colname]), summary, prof.collect() if prof.enabled else None
+
+
+def cell_cost(cell):
+    """
+    Estimate the relative cost of a cell: number of centrality calls (one per removal in the sequential case, one
+    per block otherwise) times the number of edges times the relative cost per call of the centrality.
+
+    :param cell: (tuple) Dataset name, weight, case key and centrality label.
+    :return: (float) Estimated cost.
+    """
+    name, ww, k, colname = cell
+    nodes = len(np.unique(_edges[name][:, :2]))
+    calls = nodes if k == 1 else nodes / nrem
+    return calls * len(_edges[name]) * centrality_cost.get(colname, 1)
+
+
+def results_suffix():
+    """
+    Suffix of the result files (curves, robustness and profile) of the early stopping rules: their curves are
+    truncated, so they never overwrite the full curves of the same datasets.
+
+    :return: (str) Suffix (empty without stopping rules).
+    """
+    suffix = ''
+    if stop_fraction is not None:
+        suffix += '_stop{0}'.format(stop_fraction)
+    if stop_patience is not None:
+        suffix += '_patience{0}'.format(stop_patience)
+    return suffix
+
+
+def partial_path(cell):
+    """
+    Path of the partial result of a cell run by a shard: named by the cell and by a hash of the parameters its curve
+    depends on, so that the merge never mixes cells of other settings.
+
+    :param cell: (tuple) Dataset name, weight, case key and centrality label.
+    :return: (str) Path of the JSON file.
+    """
+    name, ww, k, colname = cell
+    settings = (merge, nrem, lcc_mode, stop_fraction, stop_patience, tuple(disruption_targets), ci_radius,
+                ci_incremental, betweenness_k, betweenness_seed, katz_alpha, katz_safety, katz_tol, katz_decimals)
+    key = hashlib.sha1(repr(settings).encode()).hexdigest()[:12]
+    return os.path.join(partial_dir, '{0}_{1}_{2}_{3}_{4}nrem_{5}.json'.format(
+        name, 'Unweighted' if ww is None else 'Weighted', cases[k], colname.replace(' ', '-'), nrem, key))
+
+
+def write_results(curves, summaries):
+    """
+    Save the curves of all the cells, one CSV per dataset, weighting and case, with the robustness summaries next
+    to them (named after the stopping rules, see results_suffix).
+
+    :param curves: (dict) Iteration numbers and LCC variation curve per cell.
+    :param summaries: (dict) Robustness summary per cell (see robustness_summary).
+    """
+    suffix = results_suffix()
+    for name in filename.values():
+        for ww in w_enable:
+            for k, v in cases.items():
                 df_lcc_var = pd.DataFrame()
-                for colname, function in f.items():  # Iterate the centrality metrics to be used.
-                    df_lcc, df_lcc_var = disruption(copy.deepcopy(Gor), function, colname, lcc_init,
-                                                    df_lcc, df_lcc_var, k, ww)
-                #
-                # Exporting Results
-                #
+                # The curves truncated by a stopping rule are padded (empty cells) to the longest one
+                longest = max((curves[(name, ww, k, colname)] for colname in f), key=lambda curve: len(curve[0]))
+                df_lcc_var['No'] = longest[0]
+                for colname in f:
+                    curve = curves[(name, ww, k, colname)][1]
+                    df_lcc_var[colname] = curve + [np.nan] * (len(longest[0]) - len(curve))
                 if ww is None:
                     w_en = 'Unweighted'
                 else:
                     w_en = 'Weighted'
-                df_lcc_var.to_csv('../results/{0}/{1}/df_{2}_{3}nrem.csv'.format(v, name, w_en, nrem))
+                df_lcc_var.to_csv('../results/{0}/{1}/df_{2}_{3}nrem{4}.csv'.format(v, name, w_en, nrem, suffix))
+                df_robustness = pd.DataFrame([summaries[(name, ww, k, colname)] for colname in f], index=list(f))
+                df_robustness.index.name = 'Centrality'
+                df_robustness.to_csv('../results/{0}/{1}/robustness_{2}_{3}nrem{4}.csv'.format(v, name, w_en, nrem,
+                                                                                             suffix))
                 # To plot the results, please run network-disruption-plots.py
+
+
+def write_profiles(profiles, suffix=''):
+    """
+    Save the time breakdown of the cells run, one JSON per dataset (in total and per cell).
+
+    :param profiles: (dict) Profile per cell (see profile_utils).
+    :param suffix: (str) Suffix of the file names (e.g., of a shard).
+    :return: (dict) Profile of all the cells.
+    """
+    trace = dict()
+    for name in filename.values():
+        total = dict()
+        report = dict(dataset=name, nrem=nrem, lcc_mode=lcc_mode, csr=csr, workers=workers, cells=dict())
+        for (dataset, ww, k, colname), profile in profiles.items():
+            if dataset == name:
+                key = '{0}/{1}/{2}'.format('Unweighted' if ww is None else 'Weighted', cases[k], colname)
+                report['cells'][key] = prof.breakdown(profile, 'iteration')
+                prof.merge(total, profile)
+        report.update(prof.breakdown(total, 'iteration'))
+        prof.write_report(os.path.join(profile_dir, '{0}_profile_{1}nrem{2}.json'.format(name, nrem, suffix)), report)
+        prof.merge(trace, total)
+    return trace
+
+
+def run_sweep(point, shard=None, offset=0, merge_cells=False):
+    """
+    Run the disruptions of all the cells of a point of the sweep grid and save their curves. With a shard, only its
+    cells are run (dealt in turn to the shards, slowest first) and their curves are saved in partial_dir. With
+    merge_cells, no cell is run: the curves of the shards are gathered and saved as a single run would save them.
+
+    :param point: (dict) Parameters of the point (see configure).
+    :param shard: (tuple) Shard index and number of shards (see sweep_utils.parse_shard). None to run all the cells.
+    :param offset: (int) Cells dealt to the shards by the previous points of the grid.
+    :param merge_cells: (bool) If True, only merge the partial results of the shards.
+    :return: (tuple) Cells dealt to the shards (this point included), cells still to be run (by any shard) and
+      profile of the cells run.
+    """
+    cells = []
+    for file, name in filename.items():  #  Iterate among the datasets: Meeting e Phone Calls
+
+        #
+        # Data Extraction
+        #
+        _edges[name] = read_edges(file)
+        G = original_graph(name)
+        print("\nDataset: ", name)
+        print(nx.info(G), "\n")
+        if betweenness_sampled in f.values():
+            print("Sampled betweenness ({0} pivots): error <= {1:.3f} with probability {2}\n".format(
+                betweenness_k, betweenness_error_bound(G.number_of_nodes(), betweenness_k, betweenness_delta),
+                1 - betweenness_delta))
+        for ww in w_enable:  # Iterate between weighted (string) and unweighted (None, by default) versions.
+            for k in cases:  # Iterate between Sequential and Block nodes removal.
+                for colname in f:  # Iterate the centrality metrics to be used.
+                    cells.append((name, ww, k, colname))
+
+    #
+    # Disruption
+    #
+    # Every cell is independent: on a pool, the slowest ones are started first so that the total time is close to
+    # the one of the slowest cell (and each shard gets its share of the slow cells).
+    curves, summaries, profiles, missing = dict(), dict(), dict(), []
+    if merge_cells:
+        for cell in cells:
+            if os.path.exists(partial_path(cell)):
+                with open(partial_path(cell)) as fin:
+                    partial = json.load(fin)
+                curves[cell] = partial['iterations'], partial['curve']
+                summaries[cell] = partial['summary']
+            else:
+                missing.append(cell)
+        todo = []
+    elif shard is None:
+        todo = cells
+    else:
+        todo = sweep.select(sorted(cells, key=cell_cost, reverse=True), shard, offset)
+    if workers is None:
+        done = map(run_cell, todo)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(_edges, point))
+        done = pool.imap_unordered(run_cell, sorted(todo, key=cell_cost, reverse=True))
+    for cell, iterations, curve, summary, profile in done:
+        curves[cell] = iterations, curve
+        summaries[cell] = summary
+        if profile is not None:
+            profiles[cell] = profile
+        if shard is not None:
+            os.makedirs(partial_dir, exist_ok=True)
+            with open(partial_path(cell) + '.tmp', 'w') as fout:
+                json.dump(dict(cell=cell, iterations=iterations, curve=curve, summary=summary), fout)
+            os.replace(partial_path(cell) + '.tmp', partial_path(cell))  # Never a partial file
+    if workers is not None:
+        pool.close()
+        pool.join()
+
+    #
+    # Exporting Results
+    #
+    if shard is None and not missing:
+        write_results(curves, summaries)
+    elif shard is not None:
+        print("\nShard {0}/{1}: {2} cells run".format(shard[0], shard[1], len(todo)))
+    else:
+        print("\nIncomplete: {0} cells still to be run".format(len(missing)))
+
+    #
+    # Exporting Profiles
+    #
+    trace = dict()
+    if prof.enabled and todo:
+        trace = write_profiles(profiles, results_suffix() + ('' if shard is None else '_shard{0}of{1}'.format(*shard)))
+    return offset + len(cells), missing, trace
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Disrupt the criminal networks by removing their most central nodes")
+    parser.add_argument('--profile', action='store_true',
+                        help="save the time breakdown of each dataset in profile_dir (or CRIMINAL_NETS_PROFILE=1)")
+    parser.add_argument('--trace', action='store_true',
+                        help="also save a Chrome trace of the phases (or CRIMINAL_NETS_TRACE=1)")
+    parser.add_argument('--grid', metavar='FILE',
+                        help='JSON parameter grid, e.g. {"nrem": [5, 10], "cases": [{"1": "sequential"}]}')
+    parser.add_argument('--shard', metavar='i/N', type=sweep.parse_shard,
+                        help="only run the shard i (from 0) of N of the cells, saving their curves in partial_dir")
+    parser.add_argument('--merge', action='store_true',
+                        help="save the curves of all the cells from the partial results of the shards")
+    args = parser.parse_args()
+    if args.shard is not None and args.merge:
+        parser.error("--shard and --merge are separate steps")
+    if args.profile or args.trace:
+        prof.enable(args.trace)  # Before the pool is started, so that the workers profile too
+    offset, incomplete, trace = 0, [], dict()
+    for point in sweep.read_grid(args.grid):
+        if point:
+            print("\nGrid point:", point)
+        configure(point)
+        offset, missing, profile = run_sweep(point, args.shard, offset, args.merge)
+        incomplete += missing
+        prof.merge(trace, profile)
+    if prof.tracing:
+        prof.write_trace(os.path.join(profile_dir, 'trace.json'), trace)
+    if incomplete:
+        raise SystemExit("Incomplete sweep (run the missing shards first): {0} cells".format(len(incomplete)))
@@ -15,8 +15,19 @@ __version__ = "0.0.1"
 
 """Compute the spectral and matrix distances of a real criminal network with its edges-pruned versions"""
 
+import utilspackage.cache_utils as cache
 import utilspackage.file_utils as utils
+import utilspackage.graph_utils as graph
 import utilspackage.math_utils as math
+import utilspackage.profile_utils as prof
+import utilspackage.store_utils as store
+import utilspackage.sweep_utils as sweep
+import argparse
+import collections
+import multiprocessing
+import os
+import queue
+import hashlib
 import networkx as nx
 import prettytable
 import numpy as np
@@ -36,72 +47,654 @@ filename = {'Montagna_phonecalls_edgelist': 'PhoneCalls',
             'stockholm-gang-SN': 'Stockholm_Gang_SN'}
 
 # Simulations Configuration
-nrep = 100  # ToDo: to be adjusted
+nrep = 100  # ToDo: to be adjusted (maximum number of replicates of the adaptive mode)
+adaptive = False  # if True, draw the replicates of each level in batches until its statistics are precise enough
+batch = 10  # Replicates per batch of the adaptive mode (at least 2)
+tolerance = 0.05  # Relative standard error of Dist. A/LA/NLA and S at which the adaptive mode stops a level
+confidence = 0.95  # Level of the confidence intervals reported by the adaptive mode
 np.set_printoptions(precision=3, suppress=True)
 torem = 0.15  # Fraction of edges to be removed 0.125
 check = False  # if True, remove adjacent edges (i.e., remove the node and re-add as isolated).
+dataset_dir = '../../dataset/'  # Folder of the dataset files
+merge = 'last'  # Weight of the edges repeated in the datasets: 'last' (as read row by row), 'sum' or 'max'
+cache_dir = '../../dataset/.cache'  # Binary cache of the parsed datasets, keyed by their hash (None to disable)
+invariants_dir = '../../dataset/.cache/invariants'  # Cache of the original graphs' S and spectra (None to disable)
+invariants_size = 2 ** 30  # Bytes of the invariants cache (least recently used entries evicted above it)
+sampler = 'networkx'  # Pruning: 'networkx' (copy and prune the graph), 'array' (masks over a fixed edge array)
+#                      or 'csr' (copy and prune the compact graph of utilspackage.graph_utils, same draws as networkx)
+backend = 'dense'  # DeltaCon S backend: 'dense' (matrix inversion) or 'sparse' (sparse factorization)
+groups = None  # if int g, use the approximate DeltaCon with g random node groups (linear memory)
+groups_seed = 0  # Seed of the random node groups (shared by the original and the pruned graphs)
+groups_check = True  # if True, also compute the exact DeltaCon to report the error of the approximate one
+incremental = False  # if True, update S of the original graph by low-rank updates (eps of the original graph)
+block = 1024  # Rows of the S matrices compared at once by the Matsusita difference (bounds its memory)
+precision = 'float64'  # 'float32': S of the pruned graphs (dense backend), Matsusita difference and exact spectra in
+#                        single precision, each promoted to float64 where its error estimate exceeds math.float32_rtol
+precision_samples = 3  # Replicates per level of the float32 accuracy check (--check-precision)
+batched = False  # if True, compute the exact spectral distances of all the replicates of a level at once (sorted)
+incremental_spectra = False  # if True, update the spectra of the original graph by rank-one updates (sorted spectra)
+spectral_mode = 'exact'  # 'exact', 'partial' (top/bottom-k eigenvalues) or 'density' (stochastic Lanczos quadrature)
+spectral_k = 10  # Eigenvalues compared from each end of the spectra by the partial mode
+spectral_bottom = True  # if True, the partial mode also compares the k smallest eigenvalues
+slq_vectors = 20  # Random vectors of the density mode
+slq_steps = 30  # Lanczos steps per random vector of the density mode
+spectral_check = True  # if True, also compute the exact (sorted) spectra to report the error of the partial/density mode
+design = 'independent'  # 'independent' (fresh sample per level) or 'nested' (level j removes the first j of one order)
+workers = None  # if int, run the (dataset, level, replicate) tasks of all the datasets on a pool of that many processes
+chunk = 10  # Replicates of a level per task on the pool (also the size of the batches of the batched spectra)
+seed = None  # if int, each task draws from its own stream of (seed, dataset, level, replicate): reproducible runs
+blas_threads = 1  # BLAS threads per worker (workers * blas_threads should not exceed the number of cores)
+store_dir = '../results/store'  # Append-only store of the raw per-replicate results (None: kept in memory only)
+resume = True  # if True, skip the tasks already in the store (otherwise the store of the run is cleared)
+profile_dir = '../results/profile'  # Per-dataset time breakdowns (and trace.json) of the profiled runs (--profile)
 
-if __name__ == '__main__':
-    for file, name in filename.items():
+_states = {}  # Invariants of the original graphs, computed once per process and dataset (see setup)
+cache.configure(invariants_dir, invariants_size)  # At import, so that the spawned workers use it too
 
-        # Reading from the file and creation of the real graph
-        path = '../../dataset/' + file
-        G_real = utils.read_graph_from_file(path)
+def read_dataset(file):
+    """
+    Read a dataset, relabel its nodes from 0 and define the number of nodes (or edges) to be removed.
+    :param file: (str) Name of the dataset file (in dataset_dir, without the extension)
+    :return G_real: (Graph obj: networkx.classes.graph.Graph) Return the real graph
+    :return number_toberemoved: (int) Return the number of pruning levels
+    :return rem: (str) Return the label of the first column of the table
+    :return rtype: (str) Return the removal type ('node' or 'edge')
+    """
+    G_real = utils.read_graph_from_file(dataset_dir + file, merge, cache_dir)
+    nodes = nx.number_of_nodes(G_real)
+    if list(G_real.nodes) != [*range(0, nodes)]:
+        [G_real, mapping] = utils.relabeling_graph(G_real)
+    if check is True:
+        return G_real, int(torem * G_real.number_of_nodes()), "No. nodes", "node"
+    return G_real, int(torem * G_real.number_of_edges()), "No. edges", "edge"
+
+def setup(file):
+    """
+    Compute the invariants of the original graph of a dataset shared by all its replicates (S, spectra, ...).
+    They are computed once per process and dataset rather than shipped to the workers (solvers are not picklable).
+    S, the spectra and the eigenpairs are read from the disk cache of the invariants when enabled (see cache_utils).
+    :param file: (str) Name of the dataset file
+    :return state: (dict) Return the original graph and its invariants
+    """
+    if file in _states:
+        return _states[file]
+    G_real, number_toberemoved, rem, rtype = read_dataset(file)
+    nodes = nx.number_of_nodes(G_real)
+    state = dict(G=G_real, nodes=nodes, number=number_toberemoved, edges=math.edge_array(G_real))
+    if sampler == 'csr':
+        state['G_csr'] = graph.from_networkx(G_real)
+
+    # The sparse backend computes the fill-reducing ordering once and reuses it for every pruned graph.
+    state['perm'] = math.deltacon_ordering(G_real) if backend == 'sparse' or groups is not None else None
+    if groups is None and backend == 'sparse' and not incremental:
+        state['S'], state['perm'] = math.factorize_S(G_real, perm=state['perm'])  # S-products only: streamed by rows
+    elif groups is None:
+        state['S'] = math.compute_S(G_real, backend=backend, perm=state['perm'], cached=True)  # Compute the fast belief propagation matrix
+    else:
+        state['S'] = math.compute_S_grouped(G_real, groups, seed=groups_seed, perm=state['perm'])
+        if groups_check:
+            state['S_exact'] = math.compute_S(G_real, backend=backend, perm=state['perm'], cached=True)
+    if incremental:
+        state['eps'] = math.deltacon_system(G_real)[1]
+
+    # Matrices computation of the original graph
+    state['ENX'] = math.compute_spectra(G_real, cached=True)
+    if batched and spectral_mode == 'exact':
+        state['spectra'] = math.compute_batched_spectra(math.adjacency_stack([G_real], nodes))
+    if incremental_spectra:
+        state['eigenpairs'] = math.compute_eigenpairs(G_real, cached=True)
+    if spectral_mode == 'partial':
+        state['spectra_real'] = math.compute_partial_spectra(G_real, spectral_k, spectral_bottom)
+    elif spectral_mode == 'density':
+        state['spectra_real'] = math.compute_density_spectra(G_real, slq_vectors, slq_steps)
+    if spectral_mode != 'exact' and spectral_check:
+        state['spectra_exact'] = math.compute_batched_spectra(math.adjacency_stack([G_real], nodes))
+    _states[file] = state
+    return state
+
+def run_task(task):
+    """
+    Compute the spectral and matrix distances of the pruned graphs of some levels and replicates of a dataset.
+    With a root seed, each (dataset, level, replicate) draws from its own stream (see math.task_streams); with the
+    nested design the whole order of removal of a replicate is drawn from the stream of (dataset, replicate).
+    :param task: (tuple) Dataset index, dataset file, levels and replicates
+    :return: (tuple) Return the task with a dict of the (levels x replicates) results (and of its profile, if the
+                     profiling is enabled)
+    """
+    d, file, levels, replicates = task
+    started = prof.start()
+    state = setup(file)
+    started = prof.stop('setup', started)
+    G_real, nodes, edges, S, perm = state['G'], state['nodes'], state['edges'], state['S'], state['perm']
+    shape = (len(levels), len(replicates))
+    out = dict(var=np.zeros(shape, dtype=int), dist=np.zeros((3,) + shape), Diff=np.zeros(shape),
+               Diff_exact=np.zeros(shape), dist_exact=np.zeros((3,) + shape))
+    graphs = []
+    pyrng = nprng = None
+    for b, i in enumerate(replicates):
+        if design == 'nested':
+            # Each level prunes one more element from the previous level's graph, so the incremental S and spectra
+            # are chained along the order instead of restarting from the original graph.
+            if seed is not None:
+                pyrng, nprng = math.task_streams(seed, (d, i))
+            steps = math.nested_removal_steps(edges, nodes, state['number'], adj=check, rng=nprng)
+            keep = np.ones(len(edges), dtype=bool)
+            chain_G, chain_S, chain_eig = G_real, S, state.get('eigenpairs')
+        for a, j in enumerate(levels):
+            if design == 'nested':
+                step = edges[steps[j - 1]] if j > 0 else edges[:0]
+                if j > 0:
+                    keep[steps[j - 1]] = False
+                var = int(keep.sum())
+                Gm = math.pruned_adjacency(edges, keep, nodes)
+                removed = edges[~keep]
+            else:
+                if seed is not None:
+                    pyrng, nprng = math.task_streams(seed, (d, j, i))
+                if sampler == 'array':
+                    # Gm is the sparse adjacency matrix of the pruned graph
+                    keep, var = math.prune_edges(edges, nodes, j, adj=check, rng=nprng)
+                    Gm = math.pruned_adjacency(edges, keep, nodes)
+                    removed = edges[~keep]
+                elif sampler == 'csr':
+                    Gm, var = math.network_links_pruning(state['G_csr'], j, adj=check, rng=pyrng)
+                    removed = Gm.edges[~Gm.edge_mask]
+                else:
+                    Gm, var = math.network_links_pruning(G_real, j, adj=check, rng=pyrng)
+                    if incremental or incremental_spectra:
+                        removed = [edge for edge in G_real.edges() if not Gm.has_edge(*edge)]
+            started = prof.stop('pruning', started)
+            out['var'][a, b] = var
+            # Only S of the pruned graph computed by compute_S may be in float32: the other modes promote the
+            # Matsusita difference by comparing the same (float64) S matrices in float64
+            promote = None
+            if groups is None and incremental and design == 'nested':
+                Sm = chain_S = math.update_S(chain_S, chain_G, step, eps=state['eps'])
+            elif groups is None and incremental:
+                Sm = math.update_S(S, G_real, removed)
+            elif groups is None and backend == 'sparse':
+                Sm, perm = math.factorize_S(Gm, perm=perm)
+            elif groups is None:
+                Sm = math.compute_S(Gm, backend=backend, perm=perm, precision=precision)
+                # S of the original graph is always in float64: promoting only needs S of the pruned graph again
+                promote = lambda: (S, math.compute_S(Gm, backend=backend, perm=perm))
+            else:
+                Sm = math.compute_S_grouped(Gm, groups, seed=groups_seed, perm=perm)
+                if groups_check:
+                    Sm_exact = math.compute_S(Gm, backend=backend, perm=perm)
+                    out['Diff_exact'][a, b] = math.compute_Matsusita_difference(nodes, state['S_exact'], Sm_exact,
+                                                                               block)
+            started = prof.stop('S', started)
+            out['Diff'][a, b] = math.compute_Matsusita_difference(nodes, S, Sm, block, precision, promote)
+            started = prof.stop('matsusita', started)
+            if spectral_mode != 'exact':
+                if spectral_mode == 'partial':
+                    spectra_m = math.compute_partial_spectra(Gm, spectral_k, spectral_bottom)
+                else:
+                    spectra_m = math.compute_density_spectra(Gm, slq_vectors, slq_steps)
+                out['dist'][:, a, b] = math.spectra_distances(state['spectra_real'], spectra_m)
+                if spectral_check:
+                    out['dist_exact'][:, a, b] = np.ravel(
+                        math.compute_batched_spectral_distances(G_real, [Gm], state['spectra_exact']))
+            elif batched:
+                graphs.append(Gm)
+            elif incremental_spectra and design == 'nested':
+                chain_eig = math.update_spectra(chain_G, chain_eig, step, vectors=True)
+                out['dist'][:, a, b] = math.spectra_distances([w for w, Q in state['eigenpairs']],
+                                                              [w for w, Q in chain_eig])
+            elif incremental_spectra:
+                out['dist'][:, a, b] = math.compute_spectral_distances(
+                    G_real, Gm, eigenpairs=state['eigenpairs'], removed_edges=removed)
+            else:
+                config = zip(*state['ENX'])
+                out['dist'][:, a, b] = math.compute_spectral_distances(G_real, Gm, config, precision=precision)
+            started = prof.stop('spectra', started)
+            prof.count('replicate')
+            if design == 'nested':
+                chain_G = Gm
+    if batched and spectral_mode == 'exact':
+        # The graphs are batched in task order: replicates outer, levels inner
+        dist = math.compute_batched_spectral_distances(G_real, graphs, state['spectra'])
+        out['dist'][:] = np.reshape(dist, (3, shape[1], shape[0])).transpose(0, 2, 1)
+        prof.stop('spectra', started)
+    if prof.enabled:
+        out['profile'] = prof.collect()
+    return task, out
+
+def tasks_of(d, file, number_toberemoved, levels=None, first=0, last=None, size=None):
+    """
+    Split the levels and replicates of a dataset into tasks: (level, chunk of replicates) pairs with the
+    independent design, whole orders of removal (all the levels of a replicate) with the nested one.
+    On a single process each level is a single task, so the batched spectra batch all its replicates as before.
+    :param d: (int) Dataset index
+    :param file: (str) Dataset file
+    :param number_toberemoved: (int) Number of pruning levels
+    :param levels: (list) Levels to be split (independent design). If None, all of them
+    :param first: (int) First replicate to be split (e.g., of a batch of the adaptive mode). 0 by default
+    :param last: (int) Replicate after the last one to be split. If None, nrep
+    :param size: (int) Replicates per task. If None, chunk on the pool and all of them on a single process
+    :return: (list) Return the tasks of the dataset
+    """
+    last = nrep if last is None else last
+    if design == 'nested':
+        return [(d, file, range(number_toberemoved), [i]) for i in range(first, last)]
+    levels = range(number_toberemoved) if levels is None else levels
+    if size is None:
+        size = max(last - first, 1) if workers is None else chunk
+    return [(d, file, [j], range(c, min(c + size, last))) for j in levels for c in range(first, last, size)]
+
+def converged(res, levels, n):
+    """
+    Stopping rule of the adaptive mode: the relative standard error of the average of every statistic (Dist. A, LA,
+    NLA and S) over the first n replicates of the levels is below tolerance (or n is nrep).
+    :param res: (dict) Results of the dataset (see results_of)
+    :param levels: (list) Levels checked together (one, or all of them with the nested design)
+    :param n: (int) Number of replicates drawn (at least 2)
+    :return: (bool) Return True if no more replicates of the levels are needed
+    """
+    if n >= nrep:
+        return True
+    for j in levels:
+        for values in (res['dist'][0, j, :n], res['dist'][1, j, :n], res['dist'][2, j, :n], res['Diff'][j, :n]):
+            if math.compute_standard_error(values) > tolerance * abs(np.average(values)):
+                return False
+    return True
+
+def level_groups(number_toberemoved):
+    """
+    Levels whose replicates are drawn together by the adaptive mode: each level alone with the independent design,
+    all the levels (the same orders of removal) with the nested one.
+    :param number_toberemoved: (int) Number of pruning levels
+    :return: (list) Return the lists of levels
+    """
+    if design == 'nested':
+        return [list(range(number_toberemoved))]
+    return [[j] for j in range(number_toberemoved)]
+
+def replicates_of(res, number_toberemoved):
+    """
+    Number of replicates of each level: nrep, or with the adaptive mode the first multiple of batch at which the
+    stopping rule holds (replayed on the results, so that it is also known for a dataset read back from the store).
+    :param res: (dict) Results of the dataset (see results_of)
+    :param number_toberemoved: (int) Number of pruning levels
+    :return: (numpy.ndarray) Return the number of replicates per level
+    """
+    counts = np.full(number_toberemoved, nrep)
+    if adaptive:
+        for levels in level_groups(number_toberemoved):
+            n = min(batch, nrep)
+            while not converged(res, levels, n):
+                n = min(n + batch, nrep)
+            counts[levels] = n
+    return counts
+
+def next_batch(d, file, number_toberemoved, levels, drawn, res, finished):
+    """
+    Adaptive mode: draw the next batch of replicates of some levels, unless the stopping rule already holds. The
+    batches whose records are all in the store (of an interrupted run) are skipped.
+    :param d: (int) Dataset index
+    :param file: (str) Dataset file
+    :param number_toberemoved: (int) Number of pruning levels
+    :param levels: (list) Levels drawn together (see level_groups)
+    :param drawn: (int) Number of replicates of the levels drawn so far
+    :param res: (dict) Results of the dataset so far (see results_of)
+    :param finished: (set) (level, replicate) pairs in the store
+    :return drawn: (int) Return the number of replicates drawn, this batch included
+    :return tasks: (list) Return the tasks of the batch (empty if the levels are complete)
+    """
+    while drawn < min(batch, nrep) or not converged(res, levels, drawn):
+        tasks = tasks_of(d, file, number_toberemoved, levels, drawn, min(drawn + batch, nrep))
+        drawn = min(drawn + batch, nrep)
+        tasks = [task for task in tasks if not all((j, i) in finished for j in task[2] for i in task[3])]
+        if tasks:
+            return drawn, tasks
+    return drawn, []
+
+def results_suffix():
+    """
+    Suffix of the result files (summary CSV, store and profile) of the settings that change what the distances
+    measure, so that their results never overwrite or mix with each other: the nested design, and the spectra compared
+    by Dist. A/LA/NLA (the sorted spectra of the batched and incremental modes, the partial and density modes) when
+    they are not the exact spectra in the order of NetworkX.
+    :return: (str) Return the suffix (empty for the default settings)
+    """
+    suffix = "_nested" if design == 'nested' else ""
+    if spectral_mode == 'partial':
+        suffix += "_partial{0}{1}".format(spectral_k, "" if spectral_bottom else "top")
+    elif spectral_mode == 'density':
+        suffix += "_density"
+    elif batched or incremental_spectra:
+        suffix += "_sorted"
+    return suffix
+
+def store_path(name, rtype):
+    """
+    Directory of the result store of a dataset: named as its summary CSV, plus a hash of the settings the results
+    depend on, so that a resumed run never mixes records of other settings.
+    :param name: (str) Dataset name
+    :param rtype: (str) Removal type ('node' or 'edge')
+    :return: (str) Return the directory of the store
+    """
+    settings = (check, merge, sampler, backend, groups, groups_seed, groups_check, incremental, batched,
+                incremental_spectra, spectral_mode, spectral_k, spectral_bottom, slq_vectors, slq_steps, spectral_check,
+                design, seed, precision)
+    key = hashlib.sha1(repr(settings).encode()).hexdigest()[:12]
+    return os.path.join(store_dir, "{0}_nrep{1}_fract{2}_{3}{4}_{5}".format(name, nrep, torem, rtype,
+                                                                           results_suffix(), key))
+
+def records_of(levels, replicates, out):
+    """
+    Flatten the (levels x replicates) results of a task into records, one per (level, replicate).
+    :param levels: (list) Levels of the task
+    :param replicates: (list) Replicates of the task
+    :param out: (dict) Results of the task (see run_task)
+    :return: (dict) Return the columns of the records
+    """
+    level, replicate = np.meshgrid(list(levels), list(replicates), indexing='ij')
+    columns = dict(level=level.ravel(), replicate=replicate.ravel(), var=out['var'].ravel(), Diff=out['Diff'].ravel(),
+                   Diff_exact=out['Diff_exact'].ravel())
+    for m, matrix in enumerate(('A', 'LA', 'NLA')):
+        columns['dist_' + matrix] = out['dist'][m].ravel()
+        columns['dist_exact_' + matrix] = out['dist_exact'][m].ravel()
+    return columns
+
+def results_of(records, number_toberemoved):
+    """
+    Gather the records of a dataset into (levels x replicates) arrays, as in run_task (later records of the same
+    level and replicate replace the earlier ones).
+    :param records: (dict) Columns of the records (see records_of). If empty, the arrays are zeros
+    :param number_toberemoved: (int) Number of pruning levels
+    :return: (dict) Return the arrays of the results
+    """
+    res = dict(var=np.zeros([number_toberemoved, nrep], dtype=int), Diff=np.zeros([number_toberemoved, nrep]),
+               Diff_exact=np.zeros([number_toberemoved, nrep]), dist=np.zeros([3, number_toberemoved, nrep]),
+               dist_exact=np.zeros([3, number_toberemoved, nrep]))
+    if not records:
+        return res
+    index = records['level'], records['replicate']
+    for key in ('var', 'Diff', 'Diff_exact'):
+        res[key][index] = records[key]
+    for m, matrix in enumerate(('A', 'LA', 'NLA')):
+        res['dist'][m][index] = records['dist_' + matrix]
+        res['dist_exact'][m][index] = records['dist_exact_' + matrix]
+    return res
+
+def write_summary(name, res, number_toberemoved, rem, rtype):
+    """
+    Print the statistics of the distances per level of a dataset and save them as CSV. With the adaptive mode, each
+    row also has its number of replicates and the half-widths of the confidence intervals of the averages.
+    :param name: (str) Dataset name
+    :param res: (dict) Results of the dataset (see results_of)
+    :param number_toberemoved: (int) Number of pruning levels
+    :param rem: (str) Label of the first column of the table
+    :param rtype: (str) Removal type ('node' or 'edge')
+    """
+    labels = ["Design", rem, "Dist. A", "Err. A", "Dist. LA", "Err. LA", "Dist. NLA", "Err. NLA", "S", "Err. S",
+              "Sim."]
+    if adaptive:
+        labels += ["Rep.", "CI A", "CI LA", "CI NLA", "CI S"]
+    t = prettytable.PrettyTable(labels)
+    rows = []
+    spectral_err = []
+    sim_err = []
+    counts = replicates_of(res, number_toberemoved)
+    for j in range(number_toberemoved):
+        n = counts[j]  # The first n replicates of the level
+        dist_A, dist_LA, dist_NLA = res['dist'][:, j, :n]
+        Diff = res['Diff'][j, :n]
+
+        # Computation of statistics for Matsusita difference
+        dave, derr = math.compute_statistics(Diff, 3)
+        dsim = np.around(1 / (1 + dave), decimals=3)  # Compute the DeltaCon Similarity in [0,1] of the averaged res
+        if spectral_mode != 'exact' and spectral_check:
+            spectral_err.append(np.abs(np.average([dist_A, dist_LA, dist_NLA], axis=1) -
+                                       np.average(res['dist_exact'][:, j, :n], axis=1)))
+        if groups is not None and groups_check:
+            sim_err.append(abs(1 / (1 + np.average(Diff)) - 1 / (1 + np.average(res['Diff_exact'][j, :n]))))
+
+        # Computation of statistics for spectral distances
+        ave_da, std_da = math.compute_statistics(dist_A, 3)
+        ave_dla, std_dla = math.compute_statistics(dist_LA, 3)
+        ave_dnla, std_dnla = math.compute_statistics(dist_NLA, 3)
+
+        # Saving statistics on a PrettyTable
+        rows.append([design, res['var'][j, n - 1], ave_da, std_da, ave_dla, std_dla, ave_dnla, std_dnla, dave, derr,
+                     dsim])
+        if adaptive:
+            rows[-1] += [n] + [math.compute_confidence(values, confidence, 3) for values in (dist_A, dist_LA, dist_NLA,
+                                                                                             Diff)]
+        t.add_row(rows[-1])
+    print("\nDataset: ", name)
+    print(t)
+    if spectral_mode != 'exact' and spectral_check:
+        print("{0} spectral distances error (mean over levels): A {1:.3f}, LA {2:.3f}, NLA {3:.3f}".format(
+            spectral_mode.capitalize(), *np.average(spectral_err, axis=0)))
+    if groups is not None and groups_check:
+        print("Approximate DeltaCon (g={0}) similarity error: mean {1:.3f}, max {2:.3f}".format(
+            groups, np.average(sim_err), np.max(sim_err)))
+    suffix = results_suffix() + ("_adaptive" if adaptive else "")
+    if adaptive:
+        print("Adaptive replicates (tolerance {0}): {1} of {2}".format(tolerance, counts.sum(),
+                                                                       nrep * number_toberemoved))
+    utils.rows_to_csv(labels, rows, "../results/{0}_dist_statistics_nrep{1}_fract{2}_{3}{4}.csv".format(
+        name, nrep, torem, rtype, suffix))
+
+def check_precision():
+    """
+    Compare the float32 results (S and Matsusita difference, exact spectral distances) with the float64 ones on seeded
+    pruned graphs of every dataset in dataset_dir (precision_samples per level), and print the largest relative errors.
+    S is the dense one of compute_S whatever the DeltaCon mode, as the other modes (grouped, incremental) are always
+    computed in float64.
+    :return: (bool) Return True if all the errors are within math.float32_rtol
+    """
+    labels = ["Dataset", "Graphs", "Err. A", "Err. LA", "Err. NLA", "Err. S", "Promoted"]
+    t = prettytable.PrettyTable(labels)
+    worst = 0
+    for d, (file, name) in enumerate(filename.items()):
+        if not os.path.exists(dataset_dir + file + '.csv'):
+            print("Skipped (not in dataset_dir):", name)
+            continue
+        G_real, number_toberemoved, rem, rtype = read_dataset(file)
         nodes = nx.number_of_nodes(G_real)
-        if list(G_real.nodes) != [*range(0, nodes)]:
-            [G_real, mapping] = utils.relabeling_graph(G_real)
+        S = math.compute_S(G_real, cached=True)
+        config = math.compute_spectra(G_real, cached=True)
+        errors, count = np.zeros(4), 0
+        math.promotions.clear()
+        for j in range(number_toberemoved):
+            for i in range(precision_samples):
+                pyrng, nprng = math.task_streams(0 if seed is None else seed, (d, j, i))
+                Gm, var = math.network_links_pruning(G_real, j, adj=check, rng=pyrng)
+                exact = np.append(math.compute_spectral_distances(G_real, Gm, zip(*config)),
+                                  math.compute_Matsusita_difference(nodes, S, math.compute_S(Gm)))
+                Sm = math.compute_S(Gm, precision='float32')
+                single = np.append(math.compute_spectral_distances(G_real, Gm, zip(*config), precision='float32'),
+                                   math.compute_Matsusita_difference(nodes, S, Sm, precision='float32',
+                                                                     promote=lambda: (S, math.compute_S(Gm))))
+                errors = np.maximum(errors, np.abs(single - exact) / np.where(exact > 0, exact, 1))
+                count += 1
+        worst = max(worst, errors.max())
+        promoted = ", ".join("{0} {1}".format(key, value) for key, value in sorted(math.promotions.items()))
+        t.add_row([name, count] + ["{0:.1e}".format(error) for error in errors] + [promoted or "-"])
+    print(t)
+    print("Largest relative error: {0:.1e} (tolerance {1:.0e})".format(worst, math.float32_rtol))
+    return worst <= math.float32_rtol
+
+def configure(point):
+    """
+    Set the parameters of a point of the sweep grid in this process (also run by each worker of the pool).
+    :param point: (dict) Value per parameter (module constant), e.g. {'torem': 0.1}
+    """
+    sweep.set_point(globals(), point)
+    _states.clear()  # The invariants depend on the parameters (e.g., check and torem)
+
+def run_sweep(point, shard=None, offset=0, merge=False):
+    """
+    Run the tasks of a point of the sweep grid and save the summary table of each dataset. With a shard, only its
+    tasks are run (the (level, chunk of replicates) tasks of every dataset, dealt in turn to the shards; with the
+    adaptive mode, the levels drawn together) and their records are left in the store. With merge, no task is run:
+    the summary tables of the datasets complete in the store are saved, as a single run would save them.
+    :param point: (dict) Parameters of the point (see configure)
+    :param shard: (tuple) Shard index and number of shards (see sweep_utils.parse_shard). None to run all the tasks
+    :param offset: (int) Units of work dealt to the shards by the previous points of the grid
+    :param merge: (bool) If True, only merge the records of the shards into the summary tables
+    :return offset: (int) Return the units of work dealt to the shards, this point included
+    :return incomplete: (list) Return the names of the datasets with tasks still to be run (by any shard)
+    :return profiles: (dict) Return the profile of the tasks run (see profile_utils)
+    """
+    datasets = list(filename.items())
+    tasks, records, pending, info, profiles = [], {}, {}, {}, {}
+    stored, drawn, waiting = {}, {}, {}  # Adaptive mode: records in the store, replicates drawn and tasks per batch
+    incomplete = []
+    for d, (file, name) in enumerate(datasets):
+        # Datasets not shipped with the repository are skipped, so that the others still produce their results
+        if not os.path.exists(dataset_dir + file + '.csv'):
+            print("\nSkipped (not in dataset_dir):", name)
+            continue
+
+        # Reading from the file and creation of the real graph
+        G_real, number_toberemoved, rem, rtype = read_dataset(file)
 
         # Printing Graph info
         print("\nOriginal Real Graph\nDataset: ", name)
         print(nx.info(G_real), "\n")
-
-        # Definition of the number of edges to be removed (random or incident)
-        if check is True:
-            rem = "No. nodes"
-            number_toberemoved = int(torem * G_real.number_of_nodes())
-            print("Will be removed", number_toberemoved, "nodes")
-            rtype = "node"
+        print("Will be removed", number_toberemoved, rtype + "s")
+        info[d] = (number_toberemoved, rem, rtype)
+        records[d] = []  # Chunks of records of the dataset (as appended to its store)
+        if store_dir is not None and not resume and shard is None and not merge:
+            store.clear(store_path(name, rtype))
+        elif store_dir is not None:
+            records[d].append(store.read(store_path(name, rtype)))
+        # Tasks whose records are all in the store (of an interrupted run, or of the other shards) are not run again
+        columns = store.concatenate(records[d])
+        stored[d] = set(zip(columns['level'].tolist(), columns['replicate'].tolist())) if columns else set()
+        if stored[d]:
+            print("Resumed:", len(stored[d]), "records in the store")
+        dataset_tasks, missing = [], 0
+        if adaptive:
+            # Only the first batch of each level is known: the next ones are drawn as the batches finish
+            res, level_sets = results_of(columns, number_toberemoved), level_groups(number_toberemoved)
+            mine = [levels[0] for levels in sweep.select(level_sets, shard, offset)]
+            for levels in level_sets:
+                key = (d, levels[0])
+                drawn[key], group_tasks = next_batch(d, file, number_toberemoved, levels, 0, res, stored[d])
+                missing += len(group_tasks)
+                if levels[0] in mine and not merge:
+                    waiting[key] = len(group_tasks)
+                    dataset_tasks += group_tasks
+            offset += len(level_sets)
         else:
-            rem = "No. edges"
-            number_toberemoved = int(torem * G_real.number_of_edges())
-            print("Will be removed", number_toberemoved, "edges")
-            rtype = "edge"
+            # The shards deal the same tasks whatever their number of workers
+            all_tasks = tasks_of(d, file, number_toberemoved, size=None if shard is None else chunk)
+            for task in sweep.select(all_tasks, shard, offset):
+                if not all((j, i) in stored[d] for j in task[2] for i in task[3]) and not merge:
+                    dataset_tasks.append(task)
+            missing = sum(not all((j, i) in stored[d] for j in task[2] for i in task[3]) for task in all_tasks)
+            offset += len(all_tasks)
+        pending[d] = len(dataset_tasks)
+        tasks += dataset_tasks
 
-        labels = [rem, "Dist. A", "Err. A", "Dist. LA", "Err. LA", "Dist. NLA", "Err. NLA", "S", "Err. S", "Sim."]
-        t = prettytable.PrettyTable(labels)
+        # Datasets already complete in the store: the summary is a cheap post-processing step
+        if missing == 0 and shard is None:
+            write_summary(name, results_of(columns, number_toberemoved), *info[d])
+        elif missing > 0 and merge:
+            print("Incomplete: {0} tasks of {1} still to be run".format(missing, name))
+            incomplete.append(name)
 
-        # Configuration parameters
-        S = math.compute_S(G_real)  # Compute the fast belief propagation matrix  to compute the
+    # Computation of the spectral and matrix distances
+    if workers is not None and tasks:
+        # Spawned workers load BLAS after reading these, so each NumPy eigen/inverse call uses blas_threads threads
+        for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[variable] = str(blas_threads)
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=configure, initargs=(point,))
+    queued, done, running, finished = collections.deque(tasks), queue.Queue(), 0, 0
+    while queued or running:
+        # All the known tasks are queued on the pool, one at a time on a single process
+        while queued and (workers is not None or running == 0):
+            if workers is None:
+                done.put(run_task(queued.popleft()))
+            else:
+                pool.apply_async(run_task, (queued.popleft(),), callback=done.put, error_callback=done.put)
+            running += 1
+        result = done.get()
+        running -= 1
+        finished += 1
+        if isinstance(result, BaseException):
+            raise result
+        (d, file, levels, replicates), out = result
+        name = datasets[d][1]
+        number_toberemoved, rem, rtype = info[d]
+        if 'profile' in out:
+            prof.merge(profiles.setdefault(d, dict()), out.pop('profile'))
+        records[d].append(records_of(levels, replicates, out))
+        if store_dir is not None:
+            store.append(store_path(name, rtype), records[d][-1])  # Streamed as they finish
+        pending[d] -= 1
+        if adaptive:
+            key = (d, levels[0])
+            waiting[key] -= 1
+            if waiting[key] == 0:  # Batch finished: stop its levels, or draw their next batch
+                res = results_of(store.concatenate(records[d]), number_toberemoved)
+                drawn[key], group_tasks = next_batch(d, file, number_toberemoved, list(levels), drawn[key], res,
+                                                     stored[d])
+                waiting[key] = len(group_tasks)
+                pending[d] += len(group_tasks)
+                queued.extend(group_tasks)
+        if pending[d] > 0:
+            continue
+        if shard is None:
+            write_summary(name, results_of(store.concatenate(records[d]), number_toberemoved), *info[d])
+        if prof.enabled:
+            suffix = results_suffix() + ("_adaptive" if adaptive else "")
+            if shard is not None:
+                suffix += "_shard{0}of{1}".format(*shard)
+            report = dict(dataset=name, design=design, nrep=nrep, torem=torem, workers=workers,
+                          **prof.breakdown(profiles.get(d, dict()), 'replicate'))
+            prof.write_report(os.path.join(profile_dir, "{0}_profile_nrep{1}_fract{2}_{3}{4}.json".format(
+                name, nrep, torem, rtype, suffix)), report)
+    if workers is not None and tasks:
+        pool.close()
+        pool.join()
+    if shard is not None:
+        print("\nShard {0}/{1}: {2} tasks run".format(shard[0], shard[1], finished))
+    total = dict()
+    for profile in profiles.values():
+        prof.merge(total, profile)
+    return offset, incomplete, total
 
-        # Matrices computation of the original graph
-        ENXA = nx.adjacency_spectrum(G_real, weight=None)
-        ENXLA = nx.laplacian_spectrum(G_real, weight=None)
-        ENXNLA = nx.normalized_laplacian_spectrum(G_real, weight=None)
-
-        # Computation of the spectral and matrix distances
-        var = 0
-        for j in range(number_toberemoved):
-            dist_A = np.zeros(nrep)
-            dist_LA = np.zeros(nrep)
-            dist_NLA = np.zeros(nrep)
-            Diff = np.zeros(nrep)
-            for i in range(nrep):
-                Gm, var = math.network_links_pruning(G_real, j, adj=check)
-                Sm = math.compute_S(Gm)
-                Diff[i] = math.compute_Matsusita_difference(nodes, S, Sm)
-                config = zip(ENXA, ENXLA, ENXNLA)
-                dist_A[i], dist_LA[i], dist_NLA[i] = math.compute_spectral_distances(G_real, Gm, config)
-
-            # Computation of statistics for Matsusita difference
-            dave, derr = math.compute_statistics(Diff, 3)
-            dsim = np.around(1 / (1 + dave), decimals=3)  # Compute the DeltaCon Similarity in [0,1] of the averaged res
-
-            # Computation of statistics for spectral distances
-            ave_da, std_da = math.compute_statistics(dist_A, 3)
-            ave_dla, std_dla = math.compute_statistics(dist_LA, 3)
-            ave_dnla, std_dnla = math.compute_statistics(dist_NLA, 3)
-
-            # Saving statistics on a PrettyTable
-            t.add_row([var, ave_da, std_da, ave_dla, std_dla, ave_dnla, std_dnla, dave, derr, dsim])
-        print(t)
-        utils.ptable_to_csv(t, "../results/{0}_dist_statistics_nrep{1}_fract{2}_{3}.csv".format(name, nrep, torem, rtype))
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute the spectral and matrix distances of the criminal networks "
+                                                 "with their pruned versions")
+    parser.add_argument('--profile', action='store_true',
+                        help="save the time breakdown of each dataset in profile_dir (or CRIMINAL_NETS_PROFILE=1)")
+    parser.add_argument('--trace', action='store_true',
+                        help="also save a Chrome trace of the phases (or CRIMINAL_NETS_TRACE=1)")
+    parser.add_argument('--grid', metavar='FILE',
+                        help="JSON parameter grid, e.g. {\"torem\": [0.1, 0.15], \"check\": [false, true]}")
+    parser.add_argument('--shard', metavar='i/N', type=sweep.parse_shard,
+                        help="only run the shard i (from 0) of N of the tasks, leaving their records in store_dir")
+    parser.add_argument('--merge', action='store_true',
+                        help="save the summary tables from the records of the shards in store_dir")
+    parser.add_argument('--check-precision', action='store_true',
+                        help="only compare the float32 results with the float64 ones on every dataset (exit status 1 "
+                             "if an error exceeds math.float32_rtol)")
+    args = parser.parse_args()
+    if args.check_precision:
+        raise SystemExit(0 if check_precision() else 1)
+    if (args.shard is not None or args.merge) and store_dir is None:
+        parser.error("--shard and --merge need the store of the results (store_dir)")
+    if args.shard is not None and args.merge:
+        parser.error("--shard and --merge are separate steps")
+    if args.profile or args.trace:
+        prof.enable(args.trace)  # Before the pool is started, so that the workers profile too
+    offset, incomplete, profiles = 0, [], dict()
+    for point in sweep.read_grid(args.grid):
+        if point:
+            print("\nGrid point:", point)
+        configure(point)
+        offset, missing, profile = run_sweep(point, args.shard, offset, args.merge)
+        incomplete += missing
+        prof.merge(profiles, profile)
+    if prof.tracing:
+        prof.write_trace(os.path.join(profile_dir, "trace.json"), profiles)
+    if incomplete:
+        raise SystemExit("Incomplete datasets (run the missing shards first): " + ", ".join(incomplete))
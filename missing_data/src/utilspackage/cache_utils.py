@@ -0,0 +1,134 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+import utilspackage.graph_utils as graph
+import numpy as np
+import scipy.sparse as sp
+import hashlib
+import os
+import shutil
+
+directory = None  # Directory of the cache of the graph invariants (None: disabled, everything is computed)
+max_bytes = 2 ** 30  # Size of the cache: the least recently used entries are evicted above it
+cache_version = 1  # To be increased whenever the cached arrays change
+
+def configure(path, size=None):
+    """
+    Enable (or disable) the disk cache of the graph invariants of this process.
+    :param path: (str) Directory of the cache. If None, the cache is disabled
+    :param size: (int) Maximum size of the cache in bytes. If None, the current one (max_bytes) is kept
+    """
+    global directory, max_bytes
+    directory = path
+    if size is not None:
+        max_bytes = size
+
+def graph_hash(Graph, weight=None):
+    """
+    Hash a graph by content: its node labels in order and its edges as (sorted) pairs of node positions, with their
+    weights if weight is given. Graphs with the same nodes and edges but another node order have another hash, as
+    their matrices differ.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix, or a
+                  graph_utils.CSRGraph)
+    :param weight: (str) Name of the edge attribute of the weights. If None, the weights are not hashed
+    :return: (str) Return the hex digest of the graph
+    """
+    if sp.issparse(Graph):
+        A = sp.triu(Graph, format='coo')
+        A.eliminate_zeros()
+        labels = list(range(Graph.shape[0]))
+        pairs, weights = np.column_stack([A.row, A.col]), A.data
+    elif isinstance(Graph, graph.CSRGraph):
+        alive = np.flatnonzero(Graph.node_mask)
+        position = np.full(len(Graph.labels), -1, dtype=np.int64)
+        position[alive] = np.arange(len(alive))
+        labels = [Graph.labels[i] for i in alive]
+        pairs, weights = position[Graph.edge_list()], Graph.weights[Graph.edge_mask]
+    else:
+        labels = list(Graph)
+        index = {label: i for i, label in enumerate(labels)}
+        edges = list(Graph.edges(data=weight, default=1))
+        pairs = np.array([(index[u], index[v]) for u, v, w in edges], dtype=np.int64).reshape(-1, 2)
+        weights = np.array([w for u, v, w in edges], dtype=float)
+    pairs = np.sort(np.asarray(pairs, dtype=np.int64).reshape(-1, 2), axis=1)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    digest = hashlib.sha1(repr(labels).encode())
+    digest.update(np.ascontiguousarray(pairs[order]).tobytes())
+    if weight is not None:
+        digest.update(np.ascontiguousarray(np.asarray(weights, dtype=float)[order]).tobytes())
+    return digest.hexdigest()
+
+def cached(kind, Graph, params, compute, weight=None):
+    """
+    Return an invariant of a graph from the disk cache, or compute and store it.
+    The entries are keyed by the hash of the graph, the kind of invariant and its parameters, and hold the arrays
+    as .npy files read back as read-only memory maps. When the cache exceeds max_bytes, the least recently used
+    entries are evicted. Without a cache directory (see configure), the invariant is just computed.
+    :param kind: (str) Name of the invariant (e.g., 'S' or 'spectra')
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix, or a
+                  graph_utils.CSRGraph)
+    :param params: (tuple) Parameters the invariant depends on (their repr is part of the key)
+    :param compute: (function) Function without arguments returning the invariant as a tuple of arrays
+    :param weight: (str) Name of the edge attribute of the weights, if the invariant depends on them
+    :return: (tuple) Return the arrays of the invariant
+    """
+    if directory is None:
+        return compute()
+    key = hashlib.sha1('{0}|{1}|{2!r}|{3!r}|v{4}'.format(graph_hash(Graph, weight), kind, params, weight,
+                                                         cache_version).encode()).hexdigest()
+    path = os.path.join(directory, '{0}-{1}'.format(kind, key[:24]))
+    if os.path.isdir(path):
+        try:
+            values = tuple(np.load(os.path.join(path, '{0}.npy'.format(i)), mmap_mode='r')
+                           for i in range(len(os.listdir(path))))
+            os.utime(path)  # Most recently used
+            return values
+        except (OSError, ValueError):  # Evicted (or being evicted) by another process
+            pass
+    values = tuple(compute())
+    # Written aside and renamed, so that concurrent readers never see a partial entry
+    tmp = '{0}.tmp{1}'.format(path, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for i, value in enumerate(values):
+        np.save(os.path.join(tmp, '{0}.npy'.format(i)), np.asarray(value))
+    try:
+        os.rename(tmp, path)
+    except OSError:  # Already stored by another process
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(keep=path)
+    return values
+
+def evict(keep=None):
+    """
+    Remove the least recently used entries of the cache until its size is below max_bytes.
+    :param keep: (str) Path of an entry never to be removed (e.g., the one just stored). None by default
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if '.tmp' in name:  # Being written
+            continue
+        path = os.path.join(directory, name)
+        try:
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        except OSError:  # Removed meanwhile
+            continue
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -13,23 +13,124 @@
 __author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
 __version__ = "0.0.1"
 
+import utilspackage.graph_utils as graph
 import networkx as nx
+import numpy as np
+import hashlib
+import os
+import shutil
 
-def read_graph_from_file(filepath):
+merge_policies = ('last', 'sum', 'max')  # Weight of an edge repeated in the edge list (in either direction)
+cache_arrays = ('labels', 'indptr', 'indices', 'entry_edge', 'edges', 'weights')  # Arrays of a cached edge list
+cache_version = 1  # To be increased whenever the cached arrays change
+
+def parse_edge_list(text, merge='last'):
+    """
+    Parse an edge list (one "node node weight" row per edge, whitespace separated) in bulk.
+    The nodes are numbered in order of first appearance and the rows of the same pair of nodes (in either direction)
+    are merged into one edge, in order of first appearance and oriented as its first row, as networkx add_edge does.
+    :param text: (str) Content of the edge list
+    :param merge: (str) Weight of a repeated edge: 'last' (the one of its last row, as networkx add_edge), 'sum' or
+    'max' (of the weights of its rows)
+    :return labels: (numpy.ndarray) Return the original label of each node index
+    :return edges: (numpy.ndarray) Return the m x 2 array of the edges, as node indices
+    :return weights: (numpy.ndarray) Return the weight of each edge
+    """
+    if merge not in merge_policies:
+        raise ValueError("merge must be one of {0}, not {1!r}".format(merge_policies, merge))
+    rows = np.fromstring(text, dtype=np.int64, sep=' ')
+    if rows.size % 3 != 0:
+        raise ValueError("the edge list is not made of node, node, weight rows")
+    rows = rows.reshape(-1, 3)
+    # Node indices in order of first appearance (row by row, first node first)
+    labels, first, inverse = np.unique(rows[:, :2].ravel(), return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    labels, nodes = labels[order], rank[inverse].reshape(-1, 2)
+    # Edge indices in order of first appearance, whatever the direction of the rows
+    pairs = np.sort(nodes, axis=1)
+    keys = pairs[:, 0] * len(labels) + pairs[:, 1]
+    keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    eid = rank[inverse]
+    edges = nodes[first[order]]
+    if merge == 'last':
+        last = np.zeros(len(edges), dtype=np.int64)
+        np.maximum.at(last, eid, np.arange(len(rows)))
+        weights = rows[last, 2]
+    elif merge == 'sum':
+        weights = np.zeros(len(edges), dtype=np.int64)
+        np.add.at(weights, eid, rows[:, 2])
+    else:
+        weights = np.full(len(edges), np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(weights, eid, rows[:, 2])
+    return labels, edges, weights
+
+def load_edge_arrays(filepath, merge='last', cache_dir=None):
+    """
+    Read an edge list into the CSR arrays of its graph (see graph_utils.CSRGraph) and the labels of its nodes.
+    If cache_dir is given, the arrays are saved there as .npy files, keyed by the hash of the file and the merge
+    policy, and later reads memory-map them instead of parsing the file again.
+    :param filepath: (str) String of the complete path file (including file name) without the file extension
+    :param merge: (str) Weight of a repeated edge: 'last', 'sum' or 'max' (see parse_edge_list)
+    :param cache_dir: (str) Directory of the cached arrays. If None, the file is always parsed
+    :return arrays: (dict) Return the arrays by name: labels, indptr, indices, entry_edge, edges and weights
+    """
+    with open(filepath + '.csv', 'rb') as fin:
+        content = fin.read()
+    path = None
+    if cache_dir is not None:
+        key = hashlib.sha1(content).hexdigest()[:16]
+        path = os.path.join(cache_dir, '{0}-{1}-{2}-v{3}'.format(os.path.basename(filepath), key, merge,
+                                                               cache_version))
+        if os.path.isdir(path):
+            return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cache_arrays}
+    labels, edges, weights = parse_edge_list(content.decode(), merge)
+    G = graph.from_edges(edges, len(labels), labels=labels.tolist())
+    arrays = dict(labels=labels, indptr=G.indptr, indices=G.indices, entry_edge=G.entry_edge, edges=edges,
+                  weights=weights)
+    if path is not None:
+        # Written aside and renamed, so that concurrent readers never see a partial cache entry
+        tmp = '{0}.tmp{1}'.format(path, os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        for name in cache_arrays:
+            np.save(os.path.join(tmp, name + '.npy'), arrays[name])
+        try:
+            os.rename(tmp, path)
+        except OSError:  # Already written by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+    return arrays
+
+def read_graph_from_file(filepath, merge='last', cache_dir=None):
     """
     Read a Graph from a csv file.
     :param filepath: (str) String of the complete path file (including file name) without the file extension
+    :param merge: (str) Weight of a repeated edge: 'last' (as adding the rows one by one), 'sum' or 'max'
+    :param cache_dir: (str) Directory of the cached edge arrays (see load_edge_arrays). If None, no cache
     :return: (Graph obj: networkx.classes.graph.Graph) Return the Graph object
     """
-    fin = open(filepath + '.csv', 'r')
-    lines = fin.readlines()
+    arrays = load_edge_arrays(filepath, merge, cache_dir)
+    labels = arrays['labels'].tolist()
     Graph = nx.Graph()
-    for row in lines:
-        r = row.split()
-        n1, n2, w = int(r[0]), int(r[1]), int(r[2])
-        Graph.add_edge(n1, n2, weight=w)
+    for (i, j), w in zip(arrays['edges'].tolist(), arrays['weights'].tolist()):
+        Graph.add_edge(labels[i], labels[j], weight=w)
     return Graph
 
+def read_csr_graph(filepath, merge='last', cache_dir=None):
+    """
+    Read the compact graph of a csv file, with the node and neighbor order of read_graph_from_file.
+    :param filepath: (str) String of the complete path file (including file name) without the file extension
+    :param merge: (str) Weight of a repeated edge: 'last', 'sum' or 'max' (see parse_edge_list)
+    :param cache_dir: (str) Directory of the cached edge arrays (see load_edge_arrays). If None, no cache
+    :return: (CSRGraph obj: utilspackage.graph_utils.CSRGraph) Return the compact graph
+    """
+    arrays = load_edge_arrays(filepath, merge, cache_dir)
+    return graph.CSRGraph(arrays['labels'].tolist(), arrays['indptr'], arrays['indices'], arrays['entry_edge'],
+                          arrays['edges'], arrays['weights'])
+
 def relabeling_graph(Graph):
     """
     Relabel nodes of a Graph keeping the old nodes' labels in a dictionary.
@@ -47,6 +148,18 @@ def relabeling_graph(Graph):
     G_relabel = nx.relabel_nodes(Graph, mapping_dict)
     return G_relabel, mapping_dict
 
+def rows_to_csv(labels, rows, filename):
+    """
+    Save the rows of a table to a CSV file, each value written as PrettyTable prints it (as ptable_to_csv, without
+    rendering the table).
+    :param labels: (list) Labels of the columns (header row)
+    :param rows: (list) Rows of values
+    :param filename: (str) Filepath for the output CSV
+    """
+    with open(filename, 'w') as f:
+        for row in [labels] + list(rows):
+            f.write('{}\n'.format(','.join(str(value).strip() for value in row)))
+
 def ptable_to_csv(table, filename, headers=True):
     """Save PrettyTable results to a CSV file.
 
@@ -0,0 +1,250 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+
+class CSRGraph(object):
+    """
+    Compact undirected graph shared by the missing data and the disruption projects.
+    The structure is a symmetric CSR adjacency (each edge stored in both directions) that is never modified: node and
+    edge removals only clear masks and update the cached degree arrays, so copies are cheap and the SciPy adjacency
+    matrices share the arrays of the graph (no copy).
+    Nodes are addressed by their original labels, as in networkx (see from_networkx), and are iterated in the order
+    of the source graph, with the neighbors of each node in the order of its adjacency.
+    """
+    __slots__ = ('labels', 'index', 'indptr', 'indices', 'entry_edge', 'entries', 'edges', 'weights', 'node_mask',
+                 'edge_mask', 'ones', 'values', 'degree_array', 'wdegree_array')
+
+    def __init__(self, labels, indptr, indices, entry_edge, edges, weights):
+        """
+        Build a graph from its CSR arrays (see from_networkx and from_edges).
+        :param labels: (list) Original label of each node index
+        :param indptr: (numpy.ndarray) CSR row pointers (n + 1)
+        :param indices: (numpy.ndarray) CSR column indices (2 m)
+        :param entry_edge: (numpy.ndarray) Edge index of each CSR entry (2 m)
+        :param edges: (numpy.ndarray) The m x 2 array of the edges (node indices)
+        :param weights: (numpy.ndarray) Weight of each edge (m)
+        """
+        n, m = len(labels), len(edges)
+        self.labels = list(labels)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.indptr = indptr.astype(np.int32)
+        self.indices = indices.astype(np.int32)
+        self.entry_edge = entry_edge.astype(np.int64)
+        self.edges = edges.astype(np.int64).reshape(-1, 2)
+        self.weights = weights.astype(float)
+        # CSR positions of each edge (one per direction), to clear them on removal
+        self.entries = np.zeros((m, 2), dtype=np.int64)
+        order = np.argsort(self.entry_edge, kind='stable')
+        self.entries[:, 0], self.entries[:, 1] = order[0::2], order[1::2]
+        self.node_mask = np.ones(n, dtype=bool)
+        self.edge_mask = np.ones(m, dtype=bool)
+        self.ones = np.ones(2 * m)
+        self.values = self.weights[self.entry_edge]
+        self.degree_array = np.diff(self.indptr).astype(np.int64)
+        self.wdegree_array = np.bincount(np.repeat(np.arange(n), self.degree_array), weights=self.values,
+                                         minlength=n)
+
+    def copy(self):
+        """
+        Copy the graph: the structure arrays are shared, only the masks, entry values and degrees are copied.
+        :return: (CSRGraph) Return the copy
+        """
+        Gc = CSRGraph.__new__(CSRGraph)
+        for attr in ('labels', 'index', 'indptr', 'indices', 'entry_edge', 'entries', 'edges', 'weights'):
+            setattr(Gc, attr, getattr(self, attr))
+        for attr in ('node_mask', 'edge_mask', 'ones', 'values', 'degree_array', 'wdegree_array'):
+            setattr(Gc, attr, getattr(self, attr).copy())
+        return Gc
+
+    def __len__(self):
+        return int(self.node_mask.sum())
+
+    def __iter__(self):
+        return (self.labels[i] for i in np.flatnonzero(self.node_mask))
+
+    def __contains__(self, label):
+        return label in self.index and self.node_mask[self.index[label]]
+
+    def number_of_nodes(self):
+        """
+        :return: (int) Return the number of nodes (not removed)
+        """
+        return len(self)
+
+    def number_of_edges(self):
+        """
+        :return: (int) Return the number of edges (not removed)
+        """
+        return int(self.edge_mask.sum())
+
+    def neighbors(self, label):
+        """
+        :param label: Node label
+        :return: (iterator) Return the labels of the neighbors of the node
+        """
+        i = self.index[label]
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        alive = self.ones[start:stop] > 0
+        return (self.labels[j] for j in self.indices[start:stop][alive])
+
+    def degree(self, label=None, weight=None):
+        """
+        Read the cached degrees, as networkx Graph.degree.
+        :param label: Node label. If None, the degrees of all the nodes are returned
+        :param weight: (str) If not None, return the weighted degrees
+        :return: (int or float, or iterator) Return the degree of the node, or (label, degree) pairs
+        """
+        degree = self.degree_array if weight is None else self.wdegree_array
+        if label is not None:
+            return degree[self.index[label]].item()
+        return ((self.labels[i], degree[i].item()) for i in np.flatnonzero(self.node_mask))
+
+    def incident_edges(self, label):
+        """
+        :param label: Node label
+        :return: (numpy.ndarray) Return the indices of the edges (not removed) incident on the node
+        """
+        i = self.index[label]
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        alive = self.ones[start:stop] > 0
+        return self.entry_edge[start:stop][alive]
+
+    def remove_edges(self, eids):
+        """
+        Remove some edges: their entries are cleared and the degrees of their endpoints updated.
+        :param eids: (numpy.ndarray) Indices of the edges (not yet removed) to be removed
+        """
+        eids = np.asarray(eids, dtype=np.int64)
+        self.edge_mask[eids] = False
+        positions = self.entries[eids].ravel()
+        self.ones[positions] = 0
+        self.values[positions] = 0
+        nodes = self.edges[eids].ravel()
+        np.subtract.at(self.degree_array, nodes, 1)
+        np.subtract.at(self.wdegree_array, nodes, np.repeat(self.weights[eids], 2))
+
+    def remove_node(self, label):
+        """
+        Remove a node and its incident edges (as networkx Graph.remove_node).
+        :param label: Node label
+        """
+        self.remove_edges(self.incident_edges(label))
+        self.node_mask[self.index[label]] = False
+
+    def edge_list(self):
+        """
+        :return: (numpy.ndarray) Return the m x 2 array of the edges (not removed), as node indices
+        """
+        return self.edges[self.edge_mask]
+
+    def adjacency(self, weight=None):
+        """
+        Build the SciPy adjacency matrix over all the node indices (removed nodes and edges are zero rows and
+        explicit zeros), sharing the arrays of the graph.
+        :param weight: (str) If not None, return the weighted adjacency matrix
+        :return: (scipy.sparse.csr_matrix) Return the n x n adjacency matrix
+        """
+        n = len(self.labels)
+        data = self.ones if weight is None else self.values
+        return sp.csr_matrix((data, self.indices, self.indptr), shape=(n, n), copy=False)
+
+    def lcc_size(self):
+        """
+        Compute the size of the Largest Connected Component (LCC) of the nodes not removed.
+        :return: (int) Return the size of the LCC
+        """
+        if not self.node_mask.any():
+            return 0
+        A = self.adjacency().copy()
+        A.eliminate_zeros()  # Explicit zeros are edges for csgraph
+        ncomp, component = csgraph.connected_components(A, directed=False)
+        return int(np.bincount(component[self.node_mask]).max())
+
+    def to_networkx(self, labels=None, weight='weight'):
+        """
+        Build a networkx Graph of the nodes not removed (or of a subset of them), with the same node and neighbor
+        order.
+        :param labels: (iterable) Labels of the nodes to keep. If None, all the nodes not removed
+        :param weight: (str) Name of the edge attribute of the weights
+        :return: (Graph obj: networkx.classes.graph.Graph) Return the networkx Graph
+        """
+        keep = self.node_mask.copy()
+        if labels is not None:
+            keep[:] = False
+            keep[[self.index[label] for label in labels]] = True
+            keep &= self.node_mask
+        G = nx.Graph()
+        G.add_nodes_from(self.labels[i] for i in np.flatnonzero(keep))
+        data = dict()
+        for i in np.flatnonzero(keep):
+            start, stop = self.indptr[i], self.indptr[i + 1]
+            # The adjacency dicts are filled row by row (add_edge would append each edge to both rows at once)
+            neighbors = G._adj[self.labels[i]]
+            for position in range(start, stop):
+                j = self.indices[position]
+                if self.ones[position] > 0 and keep[j]:
+                    eid = self.entry_edge[position]
+                    if eid not in data:
+                        data[eid] = {weight: self.weights[eid].item()}
+                    neighbors[self.labels[j]] = data[eid]
+        return G
+
+def from_networkx(Graph, weight='weight'):
+    """
+    Build the compact graph of a networkx Graph (without self-loops), keeping its node order and the neighbor order
+    of each node.
+    The edges are numbered as in Graph.edges().
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
+    :param weight: (str) Name of the edge attribute of the weights (missing weights are 1)
+    :return: (CSRGraph) Return the compact graph
+    """
+    labels = list(Graph)
+    index = {label: i for i, label in enumerate(labels)}
+    edges = np.array([(index[u], index[v]) for u, v in Graph.edges()], dtype=np.int64).reshape(-1, 2)
+    weights = np.array([w for u, v, w in Graph.edges(data=weight, default=1)], dtype=float)
+    eid = {(u, v): e for e, (u, v) in enumerate(edges.tolist())}
+    indptr = np.zeros(len(labels) + 1, dtype=np.int64)
+    indices, entry_edge = [], []
+    for i, label in enumerate(labels):
+        for neighbor in Graph.neighbors(label):
+            j = index[neighbor]
+            indices.append(j)
+            entry_edge.append(eid[(i, j)] if (i, j) in eid else eid[(j, i)])
+        indptr[i + 1] = len(indices)
+    return CSRGraph(labels, indptr, np.array(indices, dtype=np.int64), np.array(entry_edge, dtype=np.int64),
+                    edges, weights)
+
+def from_edges(edges, n, weights=None, labels=None):
+    """
+    Build the compact graph of an edge array (without duplicated edges), with the neighbors of each node in the
+    order of the edges.
+    :param edges: (numpy.ndarray) The m x 2 array of the edges, as node indices 0..n-1
+    :param n: (int) Number of nodes
+    :param weights: (numpy.ndarray) Weight of each edge. If None, all the weights are 1
+    :param labels: (list) Original label of each node index. If None, the labels are 0..n-1
+    :return: (CSRGraph) Return the compact graph
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    m = len(edges)
+    weights = np.ones(m) if weights is None else np.asarray(weights, dtype=float)
+    rows = np.concatenate([edges, edges[:, ::-1]], axis=1).reshape(-1, 2)  # Both directions, edge by edge
+    order = np.argsort(rows[:, 0], kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[:, 0], minlength=n))])
+    return CSRGraph(range(n) if labels is None else labels, indptr, rows[order, 1], np.repeat(np.arange(m), 2)[order],
+                    edges, weights)
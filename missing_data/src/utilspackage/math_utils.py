@@ -13,28 +13,75 @@
 __author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
 __version__ = "0.0.1"
 
+import utilspackage.cache_utils as cache
 import utilspackage.file_utils as utils
+import utilspackage.graph_utils as graph
 import networkx as nx
 import random
 import copy
 import numpy as np
+import scipy.linalg as sla
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.stats as stats
 
-def compute_S(Graph):
+float32_rtol = 1e-3  # Precision 'float32': estimated relative error above which a result is computed again in float64
+promotions = dict()  # Results of precision 'float32' computed again in float64 by this process, per quantity
+
+def compute_S(Graph, backend='dense', perm=None, block=256, cached=False, precision='float64'):
     """
     Compute S needed for DeltaCon distance.
-    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
+    With backend='sparse' S is obtained column-block by column-block from a sparse factorization of
+    I + eps^2 D - eps A (see factorize_S), so no dense inverse is ever computed.
+    With cached, S is read from (or stored in) the disk cache of the graph invariants (see cache_utils), keyed by
+    the graph, eps and the backend: meant for the original graphs, which are the same at every run.
+    With precision='float32' the dense backend inverts in single precision, unless the condition number estimated
+    for I + eps^2 D - eps A (see deltacon_condition) makes the error larger than float32_rtol: then S is computed in
+    float64. The sparse backend always solves in float64, and only stores S in single precision.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param backend: (str) 'dense' (np.linalg.inv, default) or 'sparse' (sparse factorization)
+    :param perm: (numpy.ndarray) Fill-reducing ordering to be reused by the sparse backend. None by default
+    :param block: (int) Number of columns of S solved at once by the sparse backend
+    :param cached: (bool) If True, use the disk cache of the graph invariants. False by default
+    :param precision: (str) 'float64' (default) or 'float32'
     :return S: (numpy.matrix) Return the S matrix
     """
+    if cached:
+        eps = 1 / (1 + max_degree(Graph))
+        params = (backend, eps) if precision == 'float64' else (backend, eps, precision)
+        return np.asmatrix(cache.cached('S', Graph, params,
+                                        lambda: (np.asarray(compute_S(Graph, backend, perm, block,
+                                                                      precision=precision)),))[0])
+    if backend == 'sparse':
+        solve, perm = factorize_S(Graph, perm=perm)
+        n = _adjacency(Graph).shape[0]
+        S = np.empty((n, n), dtype=np.float32 if precision == 'float32' else float)
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            S[:, start:stop] = solve(np.identity(n)[:, start:stop])
+        return np.asmatrix(S)
+    if precision == 'float32':
+        M, eps = deltacon_system(Graph)
+        if deltacon_condition(M) * np.finfo(np.float32).eps <= float32_rtol:
+            return np.asmatrix(np.linalg.inv(M.toarray().astype(np.float32)))
+        _promote('S')
+    if _is_array_graph(Graph):
+        M, eps = deltacon_system(Graph)
+        return np.asmatrix(np.linalg.inv(M.toarray()))
+
     n = nx.number_of_nodes(Graph)
     d_max = max_degree(Graph)
     eps = 1 / (1 + d_max)
 
     # if the nodes' names are not in ascending order D matrix cannot be computed. Thus, it relabels nodes' names.
-    if list(Graph.nodes) != [*range(0, n)]:
+    # Nodes already labelled 0..n-1 (e.g., re-added isolated nodes of a pruned graph) keep their own label.
+    if set(Graph.nodes) != set(range(0, n)):
         [Graph, mapping] = utils.relabeling_graph(Graph)
         # mapping is the dictionary that keeps trace of the original nodes labels in case there is this need
     degree_g = nx.degree(Graph)
-    AM = nx.to_numpy_matrix(Graph, weight=None)  # adj matrix eigenvalues
+    # to_numpy_array since NetworkX 2.0 (to_numpy_matrix removed in 3.0), as a matrix so that S stays a matrix
+    to_numpy = getattr(nx, 'to_numpy_array', None) or nx.to_numpy_matrix
+    AM = np.asmatrix(to_numpy(Graph, nodelist=range(0, n), weight=None))  # adj matrix eigenvalues
     D = np.zeros([n, n])  # degree matrix initialisation
 
     for node, degree in degree_g:
@@ -42,51 +89,767 @@ def compute_S(Graph):
     S = np.linalg.inv(np.identity(n) + eps * eps * D - eps * AM)
     return S
 
-def compute_Matsusita_difference(n, S1, S2):
+def deltacon_system(Graph, eps=None):
+    """
+    Build the sparse DeltaCon system matrix M = I + eps^2 D - eps A, whose inverse is S.
+    M is symmetric positive definite for eps = 1 / (1 + d_max).
+    Nodes labelled 0..n-1 are indexed by their label, otherwise they are relabeled as in compute_S.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param eps: (float) Fixed eps. If None, eps = 1 / (1 + d_max) as in compute_S
+    :return M: (scipy.sparse.csc_matrix) Return the DeltaCon system matrix
+    :return eps: (float) Return the eps used to build M
+    """
+    AM = _adjacency(Graph)
+    n = AM.shape[0]
+    degree = np.asarray(AM.sum(axis=1)).ravel()
+    if eps is None:
+        eps = 1 / (1 + degree.max(initial=0))
+    M = sp.identity(n, format='csc') + eps * eps * sp.diags(degree, format='csc') - eps * AM
+    return M.tocsc(), eps
+
+def deltacon_condition(M):
+    """
+    Estimate the condition number of a DeltaCon system matrix from its Gershgorin discs: its eigenvalues lie between
+    the smallest and the largest diagonal entry minus/plus the absolute sum of the rest of its row. For
+    eps = 1 / (1 + d_max) the bound is about 2 d_max, so the error of the inverse in single precision is about
+    2 d_max times the float32 unit roundoff.
+    :param M: (scipy.sparse.csc_matrix) DeltaCon system matrix (see deltacon_system)
+    :return: (float) Return the upper bound of the condition number (inf if the discs do not exclude zero)
+    """
+    diagonal = M.diagonal()
+    radius = np.asarray(abs(M).sum(axis=1)).ravel() - np.abs(diagonal)
+    lower, upper = np.min(diagonal - radius, initial=1), np.max(diagonal + radius, initial=1)
+    return upper / lower if lower > 0 else np.inf
+
+def _promote(quantity):
+    """
+    Count a result of precision 'float32' computed again in float64 (see promotions).
+    :param quantity: (str) Name of the result (e.g., 'S' or 'DistL')
+    """
+    promotions[quantity] = promotions.get(quantity, 0) + 1
+
+def _adjacency(Graph):
+    """
+    Return the unweighted sparse adjacency matrix of a Graph, relabeling its nodes as in compute_S if they are not
+    labelled 0..n-1. A sparse adjacency matrix (e.g., from pruned_adjacency) is returned as it is, the one of a
+    compact graph shares its arrays (it must not be modified).
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix, or a
+                  graph_utils.CSRGraph)
+    :return AM: (scipy.sparse.csr_matrix) Return the adjacency matrix
+    """
+    if isinstance(Graph, graph.CSRGraph):
+        return Graph.adjacency()
+    if sp.issparse(Graph):
+        return sp.csr_matrix(Graph, dtype=float)
+    n = nx.number_of_nodes(Graph)
+    if set(Graph.nodes) != set(range(0, n)):
+        [Graph, mapping] = utils.relabeling_graph(Graph)
+    # to_scipy_sparse_array since NetworkX 2.7 (to_scipy_sparse_matrix removed in 3.0), as a csr_matrix
+    to_sparse = getattr(nx, 'to_scipy_sparse_array', None) or nx.to_scipy_sparse_matrix
+    return sp.csr_matrix(to_sparse(Graph, nodelist=range(0, n), weight=None, format='csr', dtype=float))
+
+def _is_array_graph(Graph):
+    """
+    Check whether a Graph is given as a sparse adjacency matrix or as a compact graph (graph_utils.CSRGraph), which
+    are handled through _adjacency rather than networkx.
+    :param Graph: Input Graph
+    :return: (bool) Return True for a sparse adjacency matrix or a compact graph
+    """
+    return sp.issparse(Graph) or isinstance(Graph, graph.CSRGraph)
+
+def deltacon_ordering(Graph):
+    """
+    Compute a fill-reducing symmetric ordering of the DeltaCon system matrix of a Graph.
+    Every pruned version of the Graph (same node set, subset of the edges) has a sparsity pattern contained in the
+    original one, so the ordering (i.e., the symbolic analysis) can be computed once and reused by factorize_S.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
+    :return perm: (numpy.ndarray) Return the permutation of the nodes
+    """
+    M, eps = deltacon_system(Graph)
+    lu = spla.splu(M, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0., options=dict(SymmetricMode=True))
+    return lu.perm_c
+
+def factorize_S(Graph, eps=None, perm=None):
+    """
+    Factorize the sparse DeltaCon system matrix once and return a function computing S-vector products.
+    The symmetric ordering perm is applied before a diagonal-pivoting factorization, so the same ordering can be
+    shared among all the pruned replicates of a Graph.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param eps: (float) Fixed eps. If None, eps = 1 / (1 + d_max) as in compute_S
+    :param perm: (numpy.ndarray) Fill-reducing ordering (see deltacon_ordering). If None, it is computed here
+    :return solve: (function) Return a function mapping a (n,) or (n, k) array B to the product S B
+    :return perm: (numpy.ndarray) Return the ordering used, to be reused for the pruned graphs
+    """
+    M, eps = deltacon_system(Graph, eps)
+    if perm is None:
+        perm = deltacon_ordering(Graph)
+    iperm = np.argsort(perm)
+    lu = spla.splu(M[perm, :][:, perm].tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.,
+                   options=dict(SymmetricMode=True))
+
+    def solve(B):
+        X = lu.solve(np.ascontiguousarray(np.asarray(B, dtype=float)[perm]))
+        return X[iperm]
+    return solve, perm
+
+def update_S(S, Graph, removed_edges, eps=None, threshold=0.5):
+    """
+    Derive the S matrix of a pruned Graph from the S matrix of the original one through a low-rank
+    Sherman-Morrison-Woodbury update, instead of inverting the whole matrix again.
+    Removing j edges touching k <= 2j nodes changes I + eps^2 D - eps A by U C U^T, with U the k columns of the
+    identity of the touched nodes, hence Sm = S - S U (I + C U^T S U)^-1 C U^T S in O(n^2 k).
+    eps is kept fixed at the value of the original Graph, so that the comparison stays consistent.
+    If k > threshold * n, Sm is computed from scratch (same eps), since the update would not be cheaper.
+    :param S: (numpy.matrix) The S matrix of the original Graph (see compute_S)
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Original Graph (or its sparse adjacency matrix)
+    :param removed_edges: (list) Edges removed from the original Graph
+    :param eps: (float) Fixed eps. If None, eps = 1 / (1 + d_max) of the original Graph as in compute_S
+    :param threshold: (float) Fraction of touched nodes above which a full inversion is performed
+    :return Sm: (numpy.matrix) Return the S matrix of the pruned Graph
+    """
+    S = np.asarray(S)
+    n = S.shape[0]
+    nodes = sorted({node for edge in removed_edges for node in edge})
+    k = len(nodes)
+    if k == 0:
+        return np.asmatrix(S.copy())
+    if k > threshold * n:
+        M, eps = deltacon_system(Graph, eps)
+        M = M.toarray()
+        for u, v in removed_edges:
+            M[u, u] -= eps * eps
+            M[v, v] -= eps * eps
+            M[u, v] += eps
+            M[v, u] += eps
+        return np.asmatrix(np.linalg.inv(M))
+    if eps is None:
+        eps = deltacon_system(Graph)[1]
+
+    # C is the k x k restriction of the perturbation to the touched nodes
+    index = {node: i for i, node in enumerate(nodes)}
+    C = np.zeros([k, k])
+    for u, v in removed_edges:
+        iu, iv = index[u], index[v]
+        C[iu, iu] -= eps * eps
+        C[iv, iv] -= eps * eps
+        C[iu, iv] += eps
+        C[iv, iu] += eps
+    SU = S[:, nodes]  # S U (S is symmetric, so U^T S = (S U)^T)
+    K = np.identity(k) + C @ SU[nodes, :]
+    return np.asmatrix(S - SU @ np.linalg.solve(K, C @ SU.T))
+
+def deltacon_groups(n, groups, seed=0):
+    """
+    Randomly partition the nodes into groups of (almost) equal size for the approximate DeltaCon.
+    The same seed must be used for the graphs to be compared.
+    :param n: (int) Number of nodes
+    :param groups: (int) Number of groups g
+    :param seed: (int) Seed of the random partition
+    :return: (numpy.ndarray) Return the group of each node
+    """
+    rng = np.random.RandomState(seed)
+    return rng.permutation(n) % groups
+
+def compute_S_grouped(Graph, groups, seed=0, perm=None):
+    """
+    Compute the n x g matrix S' = S E of the approximate DeltaCon (Koutra et al.), where E is the indicator matrix of
+    g random node groups. Only g sparse solves are needed, so time is O(m g) and memory O(n g).
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param groups: (int) Number of groups g
+    :param seed: (int) Seed of the random partition (see deltacon_groups)
+    :param perm: (numpy.ndarray) Fill-reducing ordering to be reused (see deltacon_ordering). None by default
+    :return S: (numpy.ndarray) Return the n x g grouped S matrix
+    """
+    n = _adjacency(Graph).shape[0]
+    solve, perm = factorize_S(Graph, perm=perm)
+    E = np.zeros([n, groups])
+    E[np.arange(n), deltacon_groups(n, groups, seed)] = 1
+    return solve(E)
+
+def compute_Matsusita_difference(n, S1, S2, block=1024, precision='float64', promote=None):
     """
     Compute Matsusita difference (also called root euclidean distance).
+    It also accepts the n x g grouped S matrices of the approximate DeltaCon.
+    The difference is accumulated over blocks of rows, so the S matrices can be numpy arrays, memory-mapped files
+    (numpy.memmap), or functions computing S-products (see factorize_S): in that case the rows are produced by
+    solves (S is symmetric) and no S matrix is ever materialized. Peak memory is 2 * block * n floats.
+    With precision='float32' the rows are compared in single precision (the squares are summed in double). The error
+    of the result is estimated from the norms of the S matrices, times the condition number of their DeltaCon system
+    for the ones computed in single precision (2 times their largest absolute row sum): if it is larger than
+    float32_rtol times the result, the difference is computed again in float64 (on the S matrices returned by promote).
     :param n: (int) number of nodes of the graphs to be compared of the same size.
-    :param S1: (numpy.matrix) The the S matrix of the first Input graph
-    :param S2: (numpy.matrix) The the S matrix of the second Input graph
+    :param S1: (numpy.matrix) The the S matrix of the first Input graph (or its S-product function)
+    :param S2: (numpy.matrix) The the S matrix of the second Input graph (or its S-product function)
+    :param block: (int) Number of rows compared at once
+    :param precision: (str) 'float64' (default) or 'float32'
+    :param promote: (function) Function returning S1 and S2 computed in float64, for the results whose error is too
+                               large in single precision. None by default (S1 and S2 compared again in float64)
     :return result: ('numpy.float64') Return the Matsusita difference
     """
+    dtype = np.float32 if precision == 'float32' else float
     counter = 0
-    for k in range(n):
-        for j in range(n):
-            counter += (S1[k, j] - S2[k, j]) * (S1[k, j] - S2[k, j])
+    norms, rowsums = np.zeros(2), np.zeros(2)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        rows = [_rows(S1, n, start, stop, dtype), _rows(S2, n, start, stop, dtype)]
+        counter += np.sum(np.square(rows[0] - rows[1]), dtype=float)
+        if precision == 'float32':
+            norms += [np.sum(np.square(R), dtype=float) for R in rows]
+            rowsums = np.maximum(rowsums, [np.max(np.sum(np.abs(R), axis=1), initial=0) for R in rows])
     result = np.sqrt(counter)
+    if precision == 'float32':
+        # Rounding of the inputs (and of the float32 inverses, amplified by their condition number) and of the rows
+        single = [getattr(S, 'dtype', None) == np.float32 for S in (S1, S2)]
+        condition = np.where(single, 2 * rowsums, 1) + 1
+        error = np.finfo(np.float32).eps * np.sum(condition * np.sqrt(norms))
+        if error > float32_rtol * result:
+            _promote('Matsusita')
+            S1, S2 = promote() if promote is not None else (S1, S2)
+            return compute_Matsusita_difference(n, S1, S2, block)
     return result
 
-def compute_spectral_distances(Graph1, Graph2, matrices=None):
+def _rows(S, n, start, stop, dtype=float):
+    """
+    Read the rows start..stop-1 of a S matrix, or compute them if S is an S-product function.
+    :param S: (numpy.matrix) The S matrix (or its S-product function)
+    :param n: (int) number of nodes
+    :param start: (int) First row
+    :param stop: (int) Last row (excluded)
+    :param dtype: (type) Type of the rows (float by default)
+    :return: (numpy.ndarray) Return the rows as a (stop - start) x columns array
+    """
+    if callable(S):
+        E = np.zeros([n, stop - start])
+        E[np.arange(start, stop), np.arange(stop - start)] = 1
+        return np.asarray(S(E).T, dtype=dtype)
+    return np.asarray(S[start:stop, :], dtype=dtype)
+
+def compute_spectral_distances(Graph1, Graph2, matrices=None, eigenpairs=None, removed_edges=None,
+                               precision='float64'):
     """
     Compute three spectral distances between two graphs (i.e., Adjacency matrix, Laplacian, and Normalised Laplacian)
     If the flag real is set to True and the ENXA, ENXLA, and ENXNLA parameters of Graph1 are given, the function
     will skip their computation.
+    If the eigenpairs of Graph1 and the edges removed from Graph1 to obtain Graph2 are given, the spectra of Graph2
+    are updated incrementally (see update_spectra) and compared in ascending order.
+    With precision='float32' the (sorted) laplacian and normalised laplacian spectra of Graph2 are computed in single
+    precision. Each eigenvalue is then off by about the float32 unit roundoff times the norm of its matrix (at most
+    its largest absolute row sum), so a distance is off by about sqrt(n) times that: the spectra whose error is larger
+    than float32_rtol times their distance are computed again in float64. The adjacency spectrum is always computed
+    in float64, as it is compared in the order of the general eigenvalue solver, which rounding errors can change.
     :param Graph1: (Graph obj: networkx.classes.graph.Graph) Input Graph1
-    :param Graph2: (Graph obj: networkx.classes.graph.Graph) Input Graph2
+    :param Graph2: (Graph obj: networkx.classes.graph.Graph) Input Graph2 (or its sparse adjacency matrix)
     :param matrices: (zip obj) zip of NetworkX adjacency,laplacian and normalizes laplacian spetra. None by default
+    :param eigenpairs: (tuple) Eigenpairs of Graph1 as returned by compute_eigenpairs. None by default
+    :param removed_edges: (list) Edges removed from Graph1 to obtain Graph2. None by default
+    :param precision: (str) 'float64' (default) or 'float32' (exact laplacian spectra of Graph2 only)
 
     :return: (numpy.float64) Return the three spectral distances between the two graphs:
                              adjacency, laplacian and normalised laplacian
     """
+    if eigenpairs is not None and removed_edges is not None:
+        ENXA, ENXLA, ENXNLA = (w for w, Q in eigenpairs)
+        ENXM, ENXLM, ENXNLM = update_spectra(Graph1, eigenpairs, removed_edges)
+        DistA = np.sqrt(np.sum(np.square(ENXA - ENXM)))
+        DistL = np.sqrt(np.sum(np.square(ENXLA - ENXLM)))
+        DistNL = np.sqrt(np.sum(np.square(ENXNLA - ENXNLM)))
+        return DistA, DistL, DistNL
+
     # If matrices!=None, unzip in ENXA ENXLA ENXNLA; otherwhise compute them.
     if matrices is None:
-        # computing eigenvalues of the: adjacency matrix, laplacian and normalized laplacian of Graph1
-        ENXA = nx.adjacency_spectrum(Graph1, weight=None)
-        ENXLA = nx.laplacian_spectrum(Graph1, weight=None)
-        ENXNLA = nx.normalized_laplacian_spectrum(Graph1, weight=None)
+        # computing eigenvalues of the: adjacency matrix, laplacian and normalized laplacian of Graph1 (the original
+        # graph, so they are read from the disk cache of the graph invariants when it is enabled)
+        ENXA, ENXLA, ENXNLA = compute_spectra(Graph1, cached=True)
     else:
         ENXA, ENXLA, ENXNLA = zip(*matrices)
+    if precision == 'float32':
+        if _is_array_graph(Graph2):
+            ENXM = sla.eigvals(_adjacency(Graph2).toarray())
+        else:
+            ENXM = nx.adjacency_spectrum(Graph2, weight=None)
+        distances = [np.sqrt(np.sum(np.square(np.real(ENXA - ENXM))))]
+        for name, spectrum, M in zip(('DistL', 'DistNL'), (ENXLA, ENXNLA), sparse_spectral_matrices(Graph2)[1:]):
+            ENXM = sla.eigvalsh(M.toarray().astype(np.float32))
+            distance = np.sqrt(np.sum(np.square(spectrum - ENXM), dtype=float))
+            if np.sqrt(M.shape[0]) * np.finfo(np.float32).eps * _max_row_sum(M) > float32_rtol * distance:
+                _promote(name)
+                distance = np.sqrt(np.sum(np.square(spectrum - sla.eigvalsh(M.toarray()))))
+            distances.append(distance)
+        return tuple(distances)
     # computing eigenvalues of the: adjacency matrix, laplacian and normalized laplacian of Graph2
-    ENXM = nx.adjacency_spectrum(Graph2, weight=None)
-    ENXLM = nx.laplacian_spectrum(Graph2, weight=None)
-    ENXNLM = nx.normalized_laplacian_spectrum(Graph2, weight=None)
+    if _is_array_graph(Graph2):
+        # same solvers as NetworkX (the order of the adjacency eigenvalues depends on the solver)
+        AM, LM, NLM = sparse_spectral_matrices(Graph2)
+        ENXM = sla.eigvals(AM.toarray())
+        ENXLM = sla.eigvalsh(LM.toarray())
+        ENXNLM = sla.eigvalsh(NLM.toarray())
+    else:
+        ENXM = nx.adjacency_spectrum(Graph2, weight=None)
+        ENXLM = nx.laplacian_spectrum(Graph2, weight=None)
+        ENXNLM = nx.normalized_laplacian_spectrum(Graph2, weight=None)
     # computing de spectral distances between the two graphs
     DistA = np.sqrt(np.sum(np.square(np.real(ENXA - ENXM))))
     DistL = np.sqrt(np.sum(np.square(np.real(ENXLA - ENXLM))))
     DistNL = np.sqrt(np.sum(np.square(np.real(ENXNLA - ENXNLM))))
     return DistA, DistL, DistNL
 
+def _max_row_sum(M):
+    """
+    Largest absolute row sum of a sparse matrix (its infinity norm, an upper bound of the 2-norm of a symmetric one).
+    :param M: (scipy.sparse.csr_matrix) Input matrix
+    :return: (float) Return the largest absolute row sum
+    """
+    return np.max(np.asarray(abs(M).sum(axis=1)).ravel(), initial=0)
+
+def compute_spectra(Graph, cached=False):
+    """
+    Compute the adjacency, laplacian and normalised laplacian spectra of a Graph, as NetworkX does (the adjacency
+    spectrum by a general eigenvalue solver, in its order).
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
+    :param cached: (bool) If True, use the disk cache of the graph invariants (see cache_utils). False by
+                          default
+    :return: (tuple) Return the three spectra: adjacency, laplacian and normalised laplacian
+    """
+    if cached:
+        return cache.cached('spectra', Graph, (), lambda: compute_spectra(Graph))
+    return (nx.adjacency_spectrum(Graph, weight=None), nx.laplacian_spectrum(Graph, weight=None),
+            nx.normalized_laplacian_spectrum(Graph, weight=None))
+
+def adjacency_stack(graphs, n):
+    """
+    Build the stacked (unweighted) adjacency matrices of a list of graphs sharing the nodes 0..n-1.
+    :param graphs: (list) List of Graph obj (networkx.classes.graph.Graph) with nodes labelled 0..n-1,
+                          or of their sparse adjacency matrices
+    :param n: (int) number of nodes
+    :return A: (numpy.ndarray) Return the (len(graphs), n, n) adjacency matrices
+    """
+    A = np.zeros([len(graphs), n, n])
+    for r, Graph in enumerate(graphs):
+        if _is_array_graph(Graph):
+            A[r] = _adjacency(Graph).toarray()
+            continue
+        edges = np.array(list(Graph.edges()), dtype=int).reshape(-1, 2)
+        A[r, edges[:, 0], edges[:, 1]] = 1
+        A[r, edges[:, 1], edges[:, 0]] = 1
+    return A
+
+def compute_batched_spectra(A):
+    """
+    Compute the adjacency, laplacian and normalised laplacian spectra of a stack of adjacency matrices.
+    L and the normalised L are derived by array operations, and one batched symmetric eigenvalue call is made per
+    matrix type.
+    :param A: (numpy.ndarray) Stacked (r, n, n) adjacency matrices (see adjacency_stack)
+    :return: (numpy.ndarray) Return the three (r, n) arrays of eigenvalues in ascending order:
+                             adjacency, laplacian and normalised laplacian
+    """
+    L, NL = laplacian_stack(A)
+    return np.linalg.eigvalsh(A), np.linalg.eigvalsh(L), np.linalg.eigvalsh(NL)
+
+def laplacian_stack(A):
+    """
+    Compute the laplacian and normalised laplacian matrices of a stack of adjacency matrices.
+    Isolated nodes get a zero row in the normalised laplacian, as in NetworkX.
+    :param A: (numpy.ndarray) Stacked (r, n, n) adjacency matrices (see adjacency_stack)
+    :return L: (numpy.ndarray) Return the (r, n, n) laplacian matrices
+    :return NL: (numpy.ndarray) Return the (r, n, n) normalised laplacian matrices
+    """
+    n = A.shape[1]
+    diag = np.arange(n)
+    degree = A.sum(axis=2)
+    L = -A
+    L[:, diag, diag] += degree
+    with np.errstate(divide='ignore'):
+        dsqrt = 1 / np.sqrt(degree)
+    dsqrt[np.isinf(dsqrt)] = 0
+    NL = dsqrt[:, :, None] * L * dsqrt[:, None, :]
+    return L, NL
+
+def compute_batched_spectral_distances(Graph1, graphs, spectra=None):
+    """
+    Compute the three spectral distances between a graph and each graph of a list (e.g., the nrep pruned replicates
+    of a removal level) with a handful of batched NumPy calls.
+    Spectra are compared in ascending order, also for the adjacency matrix.
+    :param Graph1: (Graph obj: networkx.classes.graph.Graph) Input Graph1 (nodes labelled 0..n-1)
+    :param graphs: (list) List of Graph obj (or sparse adjacency matrices) to be compared with Graph1
+    :param spectra: (tuple) Spectra of Graph1 as returned by compute_batched_spectra. None by default
+    :return: (numpy.ndarray) Return the three arrays of spectral distances (one per graph):
+                             adjacency, laplacian and normalised laplacian
+    """
+    n = nx.number_of_nodes(Graph1)
+    if spectra is None:
+        spectra = compute_batched_spectra(adjacency_stack([Graph1], n))
+    spectra_m = compute_batched_spectra(adjacency_stack(graphs, n))
+    return tuple(np.sqrt(np.sum(np.square(E1 - E2), axis=1)) for E1, E2 in zip(spectra, spectra_m))
+
+def sparse_spectral_matrices(Graph):
+    """
+    Build the sparse (unweighted) adjacency, laplacian and normalised laplacian matrices of a Graph.
+    Isolated nodes get a zero row in the normalised laplacian, as in NetworkX.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :return: (scipy.sparse.csr_matrix) Return the three matrices: adjacency, laplacian and normalised laplacian
+    """
+    A = _adjacency(Graph)
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    L = (sp.diags(degree) - A).tocsr()
+    with np.errstate(divide='ignore'):
+        dsqrt = 1 / np.sqrt(degree)
+    dsqrt[np.isinf(dsqrt)] = 0
+    NL = (sp.diags(dsqrt) @ L @ sp.diags(dsqrt)).tocsr()
+    return A, L, NL
+
+def compute_partial_spectra(Graph, k, bottom=False, dense_limit=2000):
+    """
+    Compute the k largest (and optionally the k smallest) eigenvalues of the adjacency, laplacian and normalised
+    laplacian matrices of a Graph with a sparse symmetric iterative solver (ARPACK).
+    Graphs with up to dense_limit nodes (or with 2 k >= n - 1) are solved by a dense decomposition.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param k: (int) Number of eigenvalues from each end of the spectrum
+    :param bottom: (bool) If True, also compute the k smallest eigenvalues
+    :param dense_limit: (int) Maximum number of nodes solved by a dense decomposition
+    :return: (numpy.ndarray) Return the three partial spectra in ascending order (bottom-k first, if any):
+                             adjacency, laplacian and normalised laplacian
+    """
+    spectra = []
+    for M in sparse_spectral_matrices(Graph):
+        n = M.shape[0]
+        if n <= dense_limit or 2 * k >= n - 1:
+            w = np.linalg.eigvalsh(M.toarray())
+            spectra.append(np.concatenate([w[:k], w[-k:]]) if bottom else w[-k:])
+            continue
+        w = _eigsh_values(M, k, 'LA')
+        if bottom:
+            w = np.concatenate([_eigsh_values(M, k, 'SA'), w])
+        spectra.append(np.sort(w))
+    return tuple(spectra)
+
+def _eigsh_values(M, k, which):
+    """
+    Compute k extreme eigenvalues of a sparse symmetric matrix with ARPACK, enlarging the Krylov subspace when the
+    eigenvalues are clustered (e.g., the null eigenvalues of the laplacian of a disconnected graph).
+    :param M: (scipy.sparse.csr_matrix) Symmetric matrix
+    :param k: (int) Number of eigenvalues
+    :param which: (str) 'LA' for the largest, 'SA' for the smallest eigenvalues
+    :return: (numpy.ndarray) Return the k eigenvalues
+    """
+    n = M.shape[0]
+    ncv = min(n, max(4 * k + 1, 40))
+    while True:
+        try:
+            return spla.eigsh(M, k, which=which, ncv=ncv, maxiter=10 * n, return_eigenvectors=False)
+        except spla.ArpackNoConvergence:
+            if ncv == n:
+                raise
+            ncv = min(n, 2 * ncv)
+
+def compute_density_spectra(Graph, nvec=20, steps=30, seed=0):
+    """
+    Estimate the spectra of the adjacency, laplacian and normalised laplacian matrices of a Graph by stochastic
+    Lanczos quadrature: each of nvec random vectors gives a steps-point quadrature of the spectral density, and the
+    averaged density is turned into n eigenvalues through its quantiles. Time is O(m steps nvec).
+    The same seed must be used for the graphs to be compared.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param nvec: (int) Number of random (Rademacher) vectors
+    :param steps: (int) Number of Lanczos steps per vector
+    :param seed: (int) Seed of the random vectors
+    :return: (numpy.ndarray) Return the three estimated spectra in ascending order:
+                             adjacency, laplacian and normalised laplacian
+    """
+    spectra = []
+    for M in sparse_spectral_matrices(Graph):
+        n = M.shape[0]
+        rng = np.random.RandomState(seed)
+        nodes, weights = [], []
+        for v in range(nvec):
+            theta, tau2 = _lanczos_quadrature(M, rng.choice([-1., 1.], size=n), min(steps, n))
+            nodes.append(theta)
+            weights.append(tau2 / nvec)
+        nodes, weights = np.concatenate(nodes), np.concatenate(weights)
+        order = np.argsort(nodes)
+        cdf = np.cumsum(weights[order])
+        quantiles = (np.arange(n) + 0.5) / n
+        spectra.append(nodes[order][np.minimum(np.searchsorted(cdf, quantiles * cdf[-1]), len(cdf) - 1)])
+    return tuple(spectra)
+
+def _lanczos_quadrature(M, v, steps):
+    """
+    Run a Lanczos iteration (with full reorthogonalisation) from v and return the Gauss quadrature of the spectral
+    density of M seen from v.
+    :param M: (scipy.sparse.csr_matrix) Symmetric matrix
+    :param v: (numpy.ndarray) Starting vector
+    :param steps: (int) Number of Lanczos steps
+    :return theta: (numpy.ndarray) Return the quadrature nodes (Ritz values)
+    :return tau2: (numpy.ndarray) Return the quadrature weights (summing to 1)
+    """
+    V = np.zeros([steps, len(v)])
+    alpha, beta = [], []
+    V[0] = v / np.linalg.norm(v)
+    w = M @ V[0]
+    alpha.append(w @ V[0])
+    w = w - alpha[0] * V[0]
+    for j in range(1, steps):
+        b = np.linalg.norm(w)
+        if b < 1e-10:
+            break
+        q = w / b
+        q -= V[:j].T @ (V[:j] @ q)
+        V[j] = q / np.linalg.norm(q)
+        beta.append(b)
+        w = M @ V[j] - b * V[j - 1]
+        alpha.append(w @ V[j])
+        w = w - alpha[j] * V[j]
+    theta, U = np.linalg.eigh(np.diag(alpha) + np.diag(beta, 1) + np.diag(beta, -1))
+    return theta, U[0] ** 2
+
+def spectra_distances(spectra1, spectra2):
+    """
+    Compute the Euclidean distances between the corresponding spectra of two graphs.
+    :param spectra1: (tuple) Spectra of the first graph (e.g., adjacency, laplacian and normalised laplacian)
+    :param spectra2: (tuple) Spectra of the second graph, of the same sizes
+    :return: (tuple) Return one distance per spectrum
+    """
+    return tuple(np.sqrt(np.sum(np.square(E1 - E2))) for E1, E2 in zip(spectra1, spectra2))
+
+def compute_eigenpairs(Graph, cached=False):
+    """
+    Compute the eigenpairs of the adjacency, laplacian and normalised laplacian matrices of a Graph, as needed by
+    the incremental spectra of its pruned versions (see update_spectra).
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (or its sparse adjacency matrix)
+    :param cached: (bool) If True, use the disk cache of the graph invariants (see cache_utils). False by
+                             default
+    :return: (tuple) Return the three (eigenvalues, eigenvectors) pairs in ascending order:
+                     adjacency, laplacian and normalised laplacian
+    """
+    if cached:
+        arrays = cache.cached('eigenpairs', Graph, (), lambda: sum(compute_eigenpairs(Graph), ()))
+        return tuple(zip(arrays[0::2], arrays[1::2]))
+    A = adjacency_stack([Graph], _adjacency(Graph).shape[0])
+    L, NL = laplacian_stack(A)
+    return tuple(np.linalg.eigh(M[0]) for M in (A, L, NL))
+
+def update_spectra(Graph, eigenpairs, removed_edges, max_updates=8, budget=1.0, vectors=False):
+    """
+    Compute the adjacency, laplacian and normalised laplacian spectra of a Graph pruned of a few edges from the
+    eigenpairs of the original Graph, by rank-one updates solved through the secular equation (see update_spectrum).
+    The updates only touch the rows and columns of the end nodes of the removed edges, so their columns are taken from
+    the sparse matrices of the two graphs. Each matrix falls back to a full eigenvalue decomposition before any work
+    when the bound of the rank of its update (adjacency: min(k, 2 m), laplacian: min(k, m), normalised laplacian: 2 k,
+    for m edges on k nodes) times the cost of a rank-one update is not below the cost of the decomposition, as
+    measured with NumPy and OpenBLAS: the secular solve of the eigenvalues is O(n^2), about 400 / n decompositions,
+    and the update of the eigenvectors (vectors) a n x n x n product, about half a decomposition. So the incremental
+    path only pays off for a few removed edges of graphs of about a thousand nodes or more (e.g., about 2x for one
+    edge at n = 1500, see the benchmark); it also falls back when it turns out unsafe.
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Original Graph (or its sparse adjacency matrix)
+    :param eigenpairs: (tuple) Eigenpairs of the original Graph as returned by compute_eigenpairs
+    :param removed_edges: (list) Edges removed from the original Graph
+    :param max_updates: (int) Maximum number of rank-one updates before falling back to a full decomposition
+    :param budget: (float) Work of the eigenvector updates (in units of a n x n x n product) before falling back
+                   to a full decomposition
+    :param vectors: (bool) If True, return the eigenpairs of the pruned Graph (e.g., to chain further updates)
+    :return: (numpy.ndarray) Return the three spectra of the pruned Graph in ascending order:
+                             adjacency, laplacian and normalised laplacian (eigenpairs if vectors is True)
+    """
+    A = _adjacency(Graph)
+    n = A.shape[0]
+    cost = max(400 / max(n, 1), 0.5 if vectors else 0)  # Of a rank-one update, in full decompositions
+    edges = np.asarray(removed_edges, dtype=int).reshape(-1, 2)
+    nodes = sorted(set(edges.ravel().tolist()))
+    k, m = len(nodes), len(edges)
+    removed = sp.csr_matrix((np.ones(m), (edges[:, 0], edges[:, 1])), shape=A.shape)
+    Am = A - A.multiply((removed + removed.T) > 0)
+    Am.eliminate_zeros()
+    spectra = []
+    for (w, Q), M, Mm, rank in zip(eigenpairs, sparse_spectral_matrices(A), sparse_spectral_matrices(Am),
+                                   (min(k, 2 * m), min(k, m), 2 * k)):
+        wm = None
+        if rank == 0 or (rank <= max_updates and rank * cost < 1):
+            delta = (Mm[:, nodes] - M[:, nodes]).toarray()
+            wm = update_spectrum(w, Q, delta, nodes, max_updates, budget, vectors=vectors)
+        if wm is None:
+            wm = np.linalg.eigh(Mm.toarray()) if vectors else np.linalg.eigvalsh(Mm.toarray())
+        spectra.append(wm)
+    return tuple(spectra)
+
+def update_spectrum(w, Q, delta, nodes, max_updates=8, budget=1.0, tol=1e-12, vectors=False):
+    """
+    Compute the eigenvalues of M + Delta from the eigenpairs of the symmetric matrix M, where the symmetric Delta
+    is zero outside the rows and columns of a few nodes (e.g., the end nodes of the removed edges).
+    Delta has rank r <= 2 k, so it is split into r rank-one updates, each one solved through the secular equation.
+    Unless vectors is True, the eigenvectors are never updated: only the projections of the next update vectors on
+    them (a r x n matrix, transformed as the eigenvectors would be) are carried from an update to the next, so the
+    r updates cost O(r n^2) instead of O(r n^3).
+    :param w: (numpy.ndarray) Eigenvalues of M in ascending order
+    :param Q: (numpy.ndarray) Eigenvectors of M (columns)
+    :param delta: (numpy.ndarray) The n x k columns of Delta of the given nodes
+    :param nodes: (list) The k nodes whose rows and columns hold Delta
+    :param max_updates: (int) Maximum number of rank-one updates
+    :param budget: (float) Work of the eigenvector updates (in units of a n x n x n product) above which a full
+                   decomposition is cheaper (only if vectors is True)
+    :param tol: (float) Relative tolerance for deflation and rank truncation
+    :param vectors: (bool) If True, also return the eigenvectors of M + Delta
+    :return: (numpy.ndarray) Return the eigenvalues of M + Delta in ascending order (with the eigenvectors if vectors
+                             is True), or None if the incremental path is slower or numerically unsafe (the caller is
+                             expected to fall back)
+    """
+    n = len(w)
+    if len(nodes) == 0:
+        return (w.copy(), Q.copy()) if vectors else w.copy()
+
+    # Delta = U C^T + C U^T - U C_K U^T, so its range is contained in the span of [U C]
+    k = len(nodes)
+    U = np.zeros([n, k])
+    U[nodes, np.arange(k)] = 1
+    W, R = np.linalg.qr(np.hstack([U, delta]))
+    WU = W[nodes, :].T
+    WC = W.T @ delta
+    small = WU @ WC.T + WC @ WU.T - WU @ delta[nodes, :] @ WU.T
+    rho, Y = np.linalg.eigh((small + small.T) / 2)
+    keep = np.abs(rho) > tol * max(np.abs(rho).max(), 1)
+    rho, X = rho[keep], W @ Y[:, keep]
+    if len(rho) > max_updates:
+        return None
+
+    if not vectors:
+        # Row t of H is the t-th update vector in the current eigenvectors basis
+        H = (Q.T @ X).T
+        for t in range(len(rho)):
+            z, H = H[0], H[1:]
+            w, H, kept = _rank_one_eigh(w, H, rho[t], z, vectors=len(H) > 0, tol=tol)
+            if w is None:
+                return None
+        return w
+
+    # Updating the eigenvectors of k non-deflated eigenvalues costs a n x k x k product, i.e. (k / n)^2 in units of
+    # a n x n x n product, which takes about as long as a full eigenvalue decomposition
+    work = 0
+    for t in range(len(rho)):
+        max_active = int(n * np.sqrt(max(budget - work, 0)))
+        w, Q, kept = _rank_one_eigh(w, Q, rho[t], Q.T @ X[:, t], tol=tol, max_active=max_active)
+        if w is None:
+            return None
+        work += (kept / n) ** 2
+    return w, Q
+
+def _rank_one_eigh(w, Q, rho, z, vectors=True, tol=1e-12, max_active=None):
+    """
+    Compute the eigenpairs of Q diag(w) Q^T + rho x x^T, given z = Q^T x, through the secular equation
+    1 + rho sum_j z_j^2 / (w_j - l) = 0 (Bunch, Nielsen and Sorensen).
+    Eigenvalues that are (almost) repeated or have (almost) null z_j are deflated, the roots are found by a
+    vectorised bisection from the closest pole, and the eigenvectors are computed through the Gu-Eisenstat
+    formula to keep them orthogonal.
+    :param w: (numpy.ndarray) Eigenvalues in ascending order
+    :param Q: (numpy.ndarray) Eigenvectors (columns), or any p x n matrix to be transformed as their rows are (e.g.,
+                              the projections of the next updates, see update_spectrum)
+    :param rho: (float) Weight of the rank-one update
+    :param z: (numpy.ndarray) Update vector in the eigenvectors basis
+    :param vectors: (bool) If True, also update the eigenvectors
+    :param tol: (float) Relative tolerance for deflation
+    :param max_active: (int) Maximum number of non-deflated eigenvalues for which the eigenvectors are updated
+    :return w: (numpy.ndarray) Return the updated eigenvalues in ascending order (None if the check fails or
+                               max_active is exceeded)
+    :return Q: (numpy.ndarray) Return the updated eigenvectors, or the transformed matrix (None if vectors is False)
+    :return kept: (int) Return the number of non-deflated eigenvalues
+    """
+    if rho < 0:
+        # D - |rho| z z^T = -(-D + |rho| z z^T), with -D in ascending order once reversed
+        w, Q, kept = _rank_one_eigh(-w[::-1], Q[:, ::-1], -rho, z[::-1], vectors, tol, max_active)
+        if w is None:
+            return None, None, kept
+        return -w[::-1], (Q[:, ::-1] if vectors else None), kept
+
+    n = len(w)
+    d = w.copy()
+    z = np.sqrt(rho) * z
+    Q = Q.copy() if vectors else None
+    scale = max(np.abs(d).max(), z @ z)
+
+    # Deflation of repeated eigenvalues: a Givens rotation moves z_i into z_{i+1}
+    for i in range(n - 1):
+        if d[i + 1] - d[i] <= tol * scale and z[i] != 0:
+            r = np.hypot(z[i], z[i + 1])
+            c, s = z[i + 1] / r, z[i] / r
+            z[i], z[i + 1] = 0, r
+            if vectors:
+                Q[:, i], Q[:, i + 1] = c * Q[:, i] - s * Q[:, i + 1], s * Q[:, i] + c * Q[:, i + 1]
+    active = np.abs(z) * np.sqrt(z @ z) > tol * scale
+    k = int(active.sum())
+    if k == 0:
+        return d, Q, k
+    if vectors and max_active is not None and k > max_active:
+        return None, None, k
+    da, z2 = d[active], z[active] ** 2
+
+    # Secular equation: one root in (d_i, d_i+1) and the last one in (d_k, d_k + |z|^2)
+    gap = np.append(np.diff(da), z2.sum())
+    delta = da[None, :] - da[:, None]  # delta[i, j] = d_j - d_i
+    mid = gap / 2
+    with np.errstate(divide='ignore'):
+        f_mid = 1 + np.sum(z2 / (delta - mid[:, None]), axis=1)
+    upper = (f_mid < 0) & (np.arange(k) < k - 1)
+    origin = np.arange(k) + upper
+    delta_o = da[None, :] - da[origin][:, None]
+    lo, hi = np.where(f_mid < 0, mid, 0.), np.where(f_mid < 0, gap, mid)
+    lo, hi = lo - upper * gap, hi - upper * gap
+    sigma = (lo + hi) / 2
+    todo = np.arange(k)
+    # Poles around each root (shifted by its origin): d_i and d_i+1 (none on the right of the last root), and the
+    # poles on the left of each root
+    pole_left = np.diagonal(delta_o).copy()
+    pole_right = np.append(np.diagonal(delta_o, 1), np.inf)
+    left = np.tri(k, dtype=bool)
+    last = np.arange(k) == k - 1
+    for it in range(100):
+        # Rational step on the secular function (Bunch, Nielsen and Sorensen): the terms of the poles on each side of
+        # the root are modelled by a single pole plus a constant, matching their value and derivative, so the step
+        # solves a quadratic instead of a linear model. It is safeguarded by bisection of the bracket [lo, hi]
+        everything = len(todo) == k
+        inv = (delta_o if everything else delta_o[todo]) - sigma[todo, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.reciprocal(inv, out=inv)
+            r = inv * z2  # z_j^2 / (d_j - l)
+            np.multiply(inv, r, out=inv)  # z_j^2 / (d_j - l)^2
+            mask = left if everything else left[todo]
+            psi, dpsi = np.einsum('ij,ij->i', r, mask), np.einsum('ij,ij->i', inv, mask)
+            f = 1 + r.sum(axis=1)
+            phi, dphi = f - 1 - psi, inv.sum(axis=1) - dpsi
+            a, b, end = pole_left[todo] - sigma[todo], pole_right[todo] - sigma[todo], last[todo]
+            q, s = dpsi * a ** 2, np.where(end, 0, dphi * b ** 2)
+            c = 1 + psi - dpsi * a + np.where(end, 0, phi - dphi * b)
+            # c y^2 - B y + a b f = 0 for the step y (y = a + q / c for the last root)
+            B = c * (a + b) + q + s
+            root = np.sqrt(np.maximum(B ** 2 - 4 * c * a * b * f, 0))
+            step = sigma[todo] + np.where(end, a + q / c, 2 * a * b * f / (B + np.copysign(root, B)))
+        lo[todo] = np.where(f < 0, sigma[todo], lo[todo])
+        hi[todo] = np.where(f < 0, hi[todo], sigma[todo])
+        step = np.where((step > lo[todo]) & (step < hi[todo]), step, (lo[todo] + hi[todo]) / 2)
+        # Stop when f vanishes up to its rounding error (the terms on the left of the root are negative, the ones
+        # on its right positive), or when the bracket cannot be split any further
+        done = np.abs(f) <= 4 * k * np.finfo(float).eps * (1 + np.abs(psi) + np.abs(phi))
+        done |= hi[todo] - lo[todo] <= 4 * np.finfo(float).eps * np.maximum(np.abs(da[origin[todo]]), np.abs(step))
+        sigma[todo] = np.where(done, sigma[todo], step)
+        todo = todo[~done]
+        if len(todo) == 0:
+            break
+    lam = da[origin] + sigma
+
+    # The trace of the update must be preserved, otherwise the roots are not reliable
+    if abs((lam.sum() - da.sum()) - z2.sum()) > np.sqrt(tol) * scale * k:
+        return None, None, k
+
+    wm = np.concatenate([d[~active], lam])
+    order = np.argsort(wm, kind='stable')
+    if not vectors:
+        return wm[order], None, k
+
+    # Gu-Eisenstat: z_i^2 = prod_j (l_j - d_i) / prod_j!=i (d_j - d_i)
+    P = da[origin][None, :] - da[:, None] + sigma[None, :]  # P[i, j] = l_j - d_i
+    off = ~np.eye(k, dtype=bool)
+    log_z2 = np.sum(np.log(np.abs(P)), axis=1) - np.sum(np.log(np.abs(np.where(off, delta, 1))), axis=1)
+    zhat = np.sign(z[active]) * np.sqrt(np.exp(log_z2))
+    V = (zhat[None, :] / (delta_o - sigma[:, None])).T  # V[j, i] = zhat_j / (d_j - l_i)
+    V /= np.linalg.norm(V, axis=0)
+    Qm = np.hstack([Q[:, ~active], Q[:, active] @ V])
+    return wm[order], Qm[:, order], k
+
 def distribution(Graph):
     """
     Given a networkx graph returns a list containing the nodes repeated as many times as their degree
@@ -95,6 +858,8 @@ def distribution(Graph):
     :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
     :return distr: (list) Return a list containing the nodes repeated as many times as their degree
     """
+    if isinstance(Graph, graph.CSRGraph):
+        return np.repeat(Graph.labels, Graph.degree_array).tolist()
     G_degree = list(Graph.degree())
     distr = []
     for nodeid, deg in G_degree:
@@ -107,6 +872,8 @@ def max_degree(Graph):
     :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph
     :return dmax: (int) Return the maximum degree of a Graph
     """
+    if isinstance(Graph, graph.CSRGraph):
+        return int(Graph.degree_array.max(initial=0))  # Cached degrees
     degree_g = nx.degree(Graph)
     dmax = 0
     for n, d in degree_g:
@@ -114,7 +881,7 @@ def max_degree(Graph):
             dmax = d
     return dmax
 
-def network_links_pruning(Graph, fraction, adj=False):
+def network_links_pruning(Graph, fraction, adj=False, rng=None):
     """
     Prune the network by removing a certain amount of edges.
     If node is true, the removed edges are incident on specific nodes
@@ -125,16 +892,31 @@ def network_links_pruning(Graph, fraction, adj=False):
     :param fraction: (int) Number of nodes (or edges) to be removed at once.
     :param adj: (bool) If true, remove incident edges on a specific node from the network.
                        Otherwise, removes edges from the network.
+    :param rng: (random.Random) Random generator. If None, the global random module is used
     :return: Graph: (Graph obj: networkx.classes.graph.Graph) Pruned Graph
     :return: var: (int) Number of edges removed
     """
+    rng = random if rng is None else rng
+    if isinstance(Graph, graph.CSRGraph):
+        # Same draws as for a networkx Graph: the removed nodes are isolated, the edges keep their order
+        Gm = Graph.copy()
+        indices = []
+        while adj and len(indices) < fraction:
+            index = rng.randint(0, len(Gm) - 1)
+            if index not in indices:
+                Gm.remove_edges(Gm.incident_edges(index))
+                indices.append(index)
+        for edge in range(0 if adj else fraction):
+            list_of_edges = np.flatnonzero(Gm.edge_mask)
+            Gm.remove_edges(list_of_edges[[rng.randint(0, len(list_of_edges) - 1)]])
+        return Gm, Gm.number_of_edges()
     Gm = copy.deepcopy(Graph)
     if adj:
         removed_nodes = 0
         indices = []
         while removed_nodes < fraction:
             list_of_nodes = list(Gm.nodes())
-            index = random.randint(0, len(list_of_nodes) - 1)
+            index = rng.randint(0, len(list_of_nodes) - 1)
             if Gm.neighbors(index) != 0 and index not in indices:
                 Gm.remove_node(index)
                 Gm.add_node(index)
@@ -144,11 +926,93 @@ def network_links_pruning(Graph, fraction, adj=False):
     else:
         for edge in range(fraction):
             list_of_edges = list(Gm.edges())
-            index = random.randint(0, len(list_of_edges) - 1)
+            index = rng.randint(0, len(list_of_edges) - 1)
             Gm.remove_edge(*list_of_edges[index])
         var = Gm.number_of_edges()
     return Gm, var
 
+def task_streams(seed, key):
+    """
+    Seed the random generators of one task of a sweep from a root seed and the task key (e.g., dataset, level and
+    replicate indices). The streams of different keys are independent, so the results of a task do not depend on
+    which process runs it or on the order of the tasks.
+    :param seed: (int) Root seed of the sweep
+    :param key: (tuple) Non-negative integers identifying the task
+    :return pyrng: (random.Random) Return the generator for network_links_pruning
+    :return nprng: (numpy.random.RandomState) Return the generator for prune_edges and nested_removal_steps
+    """
+    state = np.random.SeedSequence([seed, *key]).generate_state(4)
+    return random.Random(int(state[0]) << 32 | int(state[1])), np.random.RandomState(state[2:])
+
+def edge_array(Graph):
+    """
+    Build the fixed edge array of a Graph, used by the array-backed pruning (see prune_edges).
+    :param Graph: (Graph obj: networkx.classes.graph.Graph) Input Graph (nodes labelled 0..n-1, or a CSRGraph)
+    :return edges: (numpy.ndarray) Return the m x 2 array of the edges
+    """
+    if isinstance(Graph, graph.CSRGraph):
+        return Graph.edge_list()
+    return np.array(list(Graph.edges()), dtype=np.int64).reshape(-1, 2)
+
+def prune_edges(edges, n, fraction, adj=False, rng=None):
+    """
+    Array-backed version of network_links_pruning: the removals are drawn without replacement by vectorised
+    sampling and returned as a mask over the fixed edge array, so no graph is copied or modified.
+    :param edges: (numpy.ndarray) The m x 2 edge array of the original Graph (see edge_array)
+    :param n: (int) Number of nodes of the original Graph
+    :param fraction: (int) Number of nodes (or edges) to be removed at once.
+    :param adj: (bool) If true, remove incident edges on a specific node from the network.
+                       Otherwise, removes edges from the network.
+    :param rng: (numpy.random.RandomState) Random generator. If None, the global NumPy one is used
+    :return keep: (numpy.ndarray) Boolean mask of the edges kept in the pruned Graph
+    :return var: (int) Number of edges of the pruned Graph (as network_links_pruning)
+    """
+    rng = np.random if rng is None else rng
+    if adj:
+        removed = np.zeros(n, dtype=bool)
+        removed[rng.choice(n, fraction, replace=False)] = True
+        keep = ~(removed[edges[:, 0]] | removed[edges[:, 1]])
+    else:
+        keep = np.ones(len(edges), dtype=bool)
+        keep[rng.choice(len(edges), fraction, replace=False)] = False
+    return keep, int(keep.sum())
+
+def nested_removal_steps(edges, n, count, adj=False, rng=None):
+    """
+    Draw one random order of removal for a nested sweep: level j removes the first j elements of the order, so the
+    pruned Graph of level j + 1 is the one of level j without a single edge (or the edges of a single node).
+    :param edges: (numpy.ndarray) The m x 2 edge array of the original Graph (see edge_array)
+    :param n: (int) Number of nodes of the original Graph
+    :param count: (int) Number of nodes (or edges) in the order
+    :param adj: (bool) If true, the order is over the nodes (their incident edges are removed).
+                       Otherwise, it is over the edges.
+    :param rng: (numpy.random.RandomState) Random generator. If None, the global NumPy one is used
+    :return steps: (list) Return, per step, the array of the indices of the edges removed at that step
+    """
+    rng = np.random if rng is None else rng
+    if not adj:
+        return [np.array([e]) for e in rng.permutation(len(edges))[:count]]
+    removed = np.zeros(len(edges), dtype=bool)
+    steps = []
+    for node in rng.permutation(n)[:count]:
+        incident = ~removed & ((edges[:, 0] == node) | (edges[:, 1] == node))
+        removed |= incident
+        steps.append(np.flatnonzero(incident))
+    return steps
+
+def pruned_adjacency(edges, keep, n):
+    """
+    Build the sparse adjacency matrix of a pruned Graph, which can be given to compute_S and to the spectral
+    functions in place of the Graph itself.
+    :param edges: (numpy.ndarray) The m x 2 edge array of the original Graph (see edge_array)
+    :param keep: (numpy.ndarray) Boolean mask of the edges kept (see prune_edges)
+    :param n: (int) Number of nodes
+    :return AM: (scipy.sparse.csr_matrix) Return the adjacency matrix of the pruned Graph
+    """
+    e = edges[keep]
+    rows, cols = np.concatenate([e[:, 0], e[:, 1]]), np.concatenate([e[:, 1], e[:, 0]])
+    return sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
 def compute_statistics(tocompute, toround):
     """
     Given a numpy array, returns its rounded average and standard deviation as floats
@@ -160,3 +1024,23 @@ def compute_statistics(tocompute, toround):
     out, err = np.average(tocompute), np.std(tocompute)
     out, err = np.around(out, decimals=toround), np.around(err, decimals=toround)
     return out, err
+
+def compute_standard_error(tocompute):
+    """
+    Given a numpy array of at least two samples, returns the standard error of its average
+    :param tocompute: ('numpy.ndarray') Input samples
+    :return sem: ('numpy.float64') Return the sample standard deviation over the square root of the number of samples
+    """
+    return np.std(tocompute, ddof=1) / np.sqrt(len(tocompute))
+
+def compute_confidence(tocompute, level, toround):
+    """
+    Given a numpy array of at least two samples, returns the rounded half-width of the (Student t) confidence interval
+    of its average
+    :param tocompute: ('numpy.ndarray') Input samples
+    :param level: (float) Confidence level (e.g., 0.95)
+    :param toround: (int) The decimals to be rounded
+    :return ci: ('numpy.float64') Return the rounded half-width of the confidence interval
+    """
+    quantile = stats.t.ppf((1 + level) / 2, len(tocompute) - 1)
+    return np.around(quantile * compute_standard_error(tocompute), decimals=toround)
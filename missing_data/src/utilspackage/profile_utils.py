@@ -0,0 +1,138 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+import json
+import os
+import time
+
+# Opt-in through the environment (inherited by the worker processes) or enable (e.g., from a --profile option)
+enabled = os.environ.get('CRIMINAL_NETS_PROFILE', '') not in ('', '0')
+tracing = os.environ.get('CRIMINAL_NETS_TRACE', '') not in ('', '0')
+
+_timers = dict()  # Total seconds and calls per phase name
+_counters = dict()  # Value per counter name
+_events = []  # (name, start, duration, pid) of each timed phase, when tracing
+
+def enable(trace=False):
+    """
+    Enable the timers and counters in this process and in the processes it starts.
+    :param trace: (bool) If True, also record every timed phase for a Chrome trace (see write_trace)
+    """
+    global enabled, tracing
+    enabled, tracing = True, tracing or trace
+    os.environ['CRIMINAL_NETS_PROFILE'] = '1'
+    if tracing:
+        os.environ['CRIMINAL_NETS_TRACE'] = '1'
+
+def start():
+    """
+    Start timing a phase (see stop).
+    :return: (float) Return the start time, or None if the profiling is disabled
+    """
+    return time.perf_counter() if enabled else None
+
+def stop(name, started):
+    """
+    Stop timing a phase started at start() (or at the previous stop, to time consecutive phases).
+    :param name: (str) Name of the phase
+    :param started: (float) Start time of the phase
+    :return: (float) Return the stop time (the start of the next phase), or None if the profiling is disabled
+    """
+    if started is None:
+        return None
+    stopped = time.perf_counter()
+    timer = _timers.get(name)
+    if timer is None:
+        timer = _timers[name] = [0.0, 0]
+    timer[0] += stopped - started
+    timer[1] += 1
+    if tracing:
+        _events.append((name, started, stopped - started, os.getpid()))
+    return stopped
+
+def count(name, value=1):
+    """
+    Increase a counter.
+    :param name: (str) Name of the counter
+    :param value: (int) Increase
+    """
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+def collect():
+    """
+    Take the timers, counters and events recorded by this process so far (e.g., at the end of a task of a pool, to
+    ship them with its results), and reset them.
+    :return: (dict) Return the profile: timers, counters and events
+    """
+    global _timers, _counters, _events
+    profile = dict(timers=_timers, counters=_counters, events=_events)
+    _timers, _counters, _events = dict(), dict(), []
+    return profile
+
+def merge(total, profile):
+    """
+    Add a profile (see collect) to another one.
+    :param total: (dict) Profile to be increased (empty dict for a new one)
+    :param profile: (dict) Profile to be added
+    :return: (dict) Return the total profile
+    """
+    for name, (seconds, calls) in profile.get('timers', dict()).items():
+        timer = total.setdefault('timers', dict()).setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+    for name, value in profile.get('counters', dict()).items():
+        total.setdefault('counters', dict())[name] = total.get('counters', dict()).get(name, 0) + value
+    total.setdefault('events', []).extend(profile.get('events', []))
+    return total
+
+def breakdown(profile, unit):
+    """
+    Summarize a profile per phase: total seconds, calls, mean per call and mean per unit (e.g., per replicate or per
+    iteration), with the unit counted by the counter of the same name.
+    :param profile: (dict) Profile (see collect and merge)
+    :param unit: (str) Name of the counter of the units
+    :return: (dict) Return the JSON-ready breakdown
+    """
+    units = profile.get('counters', dict()).get(unit, 0)
+    phases = dict()
+    for name, (seconds, calls) in sorted(profile.get('timers', dict()).items(), key=lambda item: -item[1][0]):
+        phases[name] = dict(total=round(seconds, 6), calls=calls, mean_per_call=round(seconds / calls, 9),
+                            **{'mean_per_' + unit: round(seconds / units, 9) if units else None})
+    return dict(phases=phases, counters=profile.get('counters', dict()))
+
+def write_report(path, report):
+    """
+    Save a breakdown (see breakdown) as JSON.
+    :param path: (str) Path of the JSON file (its folder is created if missing)
+    :param report: (dict) Breakdown, with any other information (e.g., dataset name and settings)
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as fout:
+        json.dump(report, fout, indent=1)
+
+def write_trace(path, profile):
+    """
+    Save the events of a profile as a Chrome trace (chrome://tracing or Perfetto), one row per process.
+    :param path: (str) Path of the JSON file (its folder is created if missing)
+    :param profile: (dict) Profile recorded with tracing enabled
+    """
+    events = profile.get('events', [])
+    origin = min((started for name, started, duration, pid in events), default=0)
+    trace = [dict(name=name, ph='X', ts=round((started - origin) * 1e6, 3), dur=round(duration * 1e6, 3), pid=pid,
+                  tid=pid) for name, started, duration, pid in events]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as fout:
+        json.dump(dict(traceEvents=trace, displayTimeUnit='ms'), fout)
@@ -0,0 +1,74 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+import numpy as np
+import itertools
+import os
+import shutil
+import socket
+import time
+
+_counter = itertools.count()  # Chunks written by this process (part of their file names)
+
+def append(path, columns):
+    """
+    Append some records to a result store: a directory of chunks, one .npz file of columns (arrays of the same
+    length, one entry per record) per call. The chunks are never modified, so a crash loses at most the records
+    being written.
+    :param path: (str) Directory of the store (created if missing)
+    :param columns: (dict) Arrays of the records by column name
+    """
+    os.makedirs(path, exist_ok=True)
+    # Named by time of writing, so that the chunks are read back in order (and by host, so that the chunks written by
+    # several machines can be gathered in a single store)
+    name = 'chunk-{0:020d}-{1}-{2}-{3}.npz'.format(time.time_ns(), socket.gethostname(), os.getpid(), next(_counter))
+    tmp = os.path.join(path, '.' + name)
+    np.savez(tmp, **columns)
+    os.rename(tmp, os.path.join(path, name))
+
+def read(path):
+    """
+    Read all the records of a result store, in order of writing.
+    :param path: (str) Directory of the store
+    :return: (dict) Return the arrays of the records by column name (empty if there is no record)
+    """
+    if not os.path.isdir(path):
+        return dict()
+    chunks = []
+    for name in sorted(os.listdir(path)):
+        if not name.startswith('chunk-'):
+            continue
+        with np.load(os.path.join(path, name)) as data:
+            chunks.append({column: data[column] for column in data.files})
+    return concatenate(chunks)
+
+def concatenate(chunks):
+    """
+    Concatenate some records column by column (e.g., the ones appended to a store, kept in memory).
+    :param chunks: (list) Columns of the records (dicts of arrays with the same keys), in order of writing
+    :return: (dict) Return the arrays of the records by column name (empty if there is no record)
+    """
+    columns = dict()
+    for chunk in chunks:
+        for column, values in chunk.items():
+            columns.setdefault(column, []).append(values)
+    return {column: np.concatenate(arrays) for column, arrays in columns.items()}
+
+def clear(path):
+    """
+    Remove all the records of a result store.
+    :param path: (str) Directory of the store
+    """
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,73 @@
+# If you use parts of this code please cite the following articles:
+
+# @article{ficaracavallaroetal2021missingdata,
+#     title={Criminal Networks Analysis in Missing Data scenarios through Graph Distances},
+#     author={Ficara, Annamaria and Cavallaro, Lucia and Curreri, Francesco and Fiumara, Giacomo and De Meo,
+#             Pasquale and Bagdasar, Ovidiu and Song, Wei and Liotta, Antonio},
+#     year={2021},
+#     eprint={2103.00457},
+#     archivePrefix={arXiv},
+#     primaryClass={cs.SI}
+# }
+
+__author__ = "Lucia Cavallaro, and Giacomo Fiumara, and Annamaria Ficara"
+__version__ = "0.0.1"
+
+import itertools
+import json
+
+def read_grid(path):
+    """
+    Read a parameter grid: a JSON object with a list of values per parameter (module constant of the main), e.g.
+    {"torem": [0.1, 0.15], "check": [false, true]}. The points of the grid are all the combinations of the values,
+    the first parameter varying the slowest.
+    :param path: (str) Path of the JSON file. If None, the grid has a single point (the constants of the main)
+    :return: (list) Return the points of the grid, as dicts of the parameters to be set
+    """
+    if path is None:
+        return [dict()]
+    with open(path) as fin:
+        grid = json.load(fin)
+    if not isinstance(grid, dict) or not all(isinstance(values, list) and values for values in grid.values()):
+        raise ValueError("The grid must map each parameter to a non-empty list of values: " + path)
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+def set_point(namespace, point):
+    """
+    Set the parameters of a point of a grid as the module constants of a main.
+    :param namespace: (dict) Global namespace of the main (its globals())
+    :param point: (dict) Value per parameter
+    """
+    for name, value in point.items():
+        if name.startswith('_') or name not in namespace or callable(namespace[name]):
+            raise KeyError("Not a parameter of the sweep: " + name)
+        if isinstance(namespace[name], dict) and isinstance(value, dict):
+            # JSON keys are strings: back to the type of the keys of the constant (e.g., the int keys of cases)
+            key_type = type(next(iter(namespace[name]), ''))
+            value = {key_type(key): item for key, item in value.items()}
+        namespace[name] = value
+
+def parse_shard(text):
+    """
+    Parse a shard selection 'i/N': the shard i (from 0 to N - 1) of N.
+    :param text: (str) Shard selection
+    :return: (tuple) Return the shard index and the number of shards
+    """
+    index, count = (int(value) for value in text.split('/'))
+    if not 0 <= index < count:
+        raise ValueError("The shard must be i/N with 0 <= i < N: " + text)
+    return index, count
+
+def select(units, shard, offset=0):
+    """
+    Select the units of work (tasks, cells, ...) of a shard: every N-th unit of a deterministic enumeration starting
+    from the i-th, so that the N shards split the units evenly (slowest units first, if so sorted).
+    :param units: (list) Units of work, in the same order on every shard
+    :param shard: (tuple) Shard index and number of shards (see parse_shard). If None, all the units are selected
+    :param offset: (int) Units enumerated before these ones (e.g., by the previous points of the grid)
+    :return: (list) Return the units of the shard
+    """
+    if shard is None:
+        return list(units)
+    index, count = shard
+    return [unit for k, unit in enumerate(units) if (offset + k) % count == index]